@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# alternative rankings of an event, next to the official one of results.py
+#
+# - z-score: every vote is standardised against the other votes of the same voter, so that generous
+#   and harsh voters weigh the same. entries are ranked by the mean z-score they received
+# - borda: every vote becomes the share of the voter's other votes it beats (ties count half),
+#   from 0 to 1. entries are ranked by the mean they received
+# - bootstrap: the voters are resampled with replacement, and the official score recomputed for each
+#   resample, which gives a confidence interval for the rank of every entry.
+#   all resamples are computed at once, as one matrix product
+#
+# the inputs are voters x entries matrices of the votes (0 where there is none)
+# with the entries in the order of the official ranking
+
+import numpy
+from typing import Dict, List
+
+
+bootstrap_resamples = 10000
+confidence = 0.95
+
+vote_range = 5
+
+
+# rank of each value, highest first. equal values share the best rank (1, 2, 2, 4)
+def competition_ranks(values: numpy.ndarray) -> numpy.ndarray:
+    return (values[None, :] > values[:, None]).sum(axis=1) + 1
+
+
+# voters x entries z-scores, 0 where there is no vote
+def zscores(votes: numpy.ndarray) -> numpy.ndarray:
+    cast = votes > 0
+    counts = cast.sum(axis=1, keepdims=True)
+    safe_counts = numpy.maximum(counts, 1)
+
+    means = votes.sum(axis=1, keepdims=True) / safe_counts
+    deviations = numpy.where(cast, votes - means, 0.0)
+    stds = numpy.sqrt((deviations ** 2).sum(axis=1, keepdims=True) / safe_counts)
+
+    # a voter who gave everyone the same vote has no preference to express
+    return numpy.where(stds > 0, deviations / numpy.where(stds > 0, stds, 1), 0.0)
+
+
+# voters x entries borda points, 0 where there is no vote
+def borda_points(votes: numpy.ndarray) -> numpy.ndarray:
+    cast = votes > 0
+    # voters x vote values, how many of each value every voter gave
+    value_counts = (votes[:, :, None] == numpy.arange(1, vote_range + 1)).sum(axis=1)
+    # how many of the voter's votes are lower than each value
+    lower_counts = numpy.cumsum(value_counts, axis=1) - value_counts
+
+    rows = numpy.arange(len(votes))[:, None]
+    values = numpy.maximum(votes, 1) - 1
+    lower = lower_counts[rows, values]
+    # the vote itself doesn't tie with itself
+    equal = value_counts[rows, values] - 1
+
+    others = numpy.maximum(cast.sum(axis=1, keepdims=True) - 1, 1)
+    return numpy.where(cast, (lower + 0.5 * equal) / others, 0.0)
+
+
+def mean_received(points: numpy.ndarray, cast: numpy.ndarray) -> numpy.ndarray:
+    return points.sum(axis=0) / numpy.maximum(cast.sum(axis=0), 1)
+
+
+# resamples x entries ranks of the official score, for resamples of the voters.
+# ties keep the official order, like the tie-breaks of the official ranking mostly do
+def bootstrap_ranks(votes: numpy.ndarray, resamples: int, seed: int) -> numpy.ndarray:
+    rng = numpy.random.default_rng(seed)
+    voters, entries = votes.shape
+
+    # how many times each voter is drawn in each resample.
+    # counting the draws of all resamples with one bincount is much faster than rng.multinomial
+    draws = rng.integers(0, voters, (resamples, voters)) + numpy.arange(resamples)[:, None] * voters
+    weights = numpy.bincount(draws.ravel(), minlength=resamples * voters).reshape(resamples, voters)
+    scores = weights.astype(numpy.float64) @ votes.astype(numpy.float64)
+
+    order = numpy.argsort(-scores, axis=1, kind="stable")
+    ranks = numpy.empty_like(order)
+    numpy.put_along_axis(ranks, order, numpy.broadcast_to(numpy.arange(1, entries + 1), order.shape), axis=1)
+    return ranks
+
+
+# names in the official order, with their official placement and score.
+# seed makes the bootstrap reproducible, so that regenerating an event gives the same file
+def compute_rankings(votes: numpy.ndarray, names: List[str], placements: List[int], seed: int,
+                     resamples=bootstrap_resamples) -> Dict:
+    # voters who didn't vote for any of the entries don't count in the resampling
+    votes = votes[(votes > 0).any(axis=1)]
+    cast = votes > 0
+
+    zscore = mean_received(zscores(votes), cast)
+    borda = mean_received(borda_points(votes), cast)
+
+    tail = (1 - confidence) / 2 * 100
+    if len(votes):
+        ranks = bootstrap_ranks(votes, resamples, seed)
+        low, median, high = numpy.percentile(ranks, [tail, 50, 100 - tail], axis=0, method="nearest")
+    else:
+        low = median = high = numpy.arange(1, len(names) + 1)
+
+    zscore_ranks = competition_ranks(zscore)
+    borda_ranks = competition_ranks(borda)
+
+    entries = []
+    for i, name in enumerate(names):
+        entries.append({
+            "name": name,
+            "placement": placements[i],
+            "score": int(votes[:, i].sum()),
+            "zscore": round(float(zscore[i]), 3),
+            "zscore_rank": int(zscore_ranks[i]),
+            "borda": round(float(borda[i]), 3),
+            "borda_rank": int(borda_ranks[i]),
+            "rank_median": int(median[i]),
+            "rank_low": int(low[i]),
+            "rank_high": int(high[i]),
+        })
+
+    return {
+        "bootstrap": {"resamples": resamples if len(votes) else 0, "confidence": confidence},
+        "entries": entries,
+    }
+
+
+def sheet_rows(rankings: Dict):
+    confidence_percent = round(rankings["bootstrap"]["confidence"] * 100)
+    yield [None, "name", "placement", "score", "z-score", "z-score rank", "borda", "borda rank",
+           "rank median", f"rank {confidence_percent}% low", f"rank {confidence_percent}% high"]
+    for i, entry in enumerate(rankings["entries"]):
+        yield [i, entry["name"], entry["placement"], entry["score"], entry["zscore"], entry["zscore_rank"],
+               entry["borda"], entry["borda_rank"], entry["rank_median"], entry["rank_low"], entry["rank_high"]]
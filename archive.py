@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import asyncio
+import time
+import threading
+from concurrent.futures import Future
+from typing import List, Dict, Optional
+import common as c
+import metrics
+
+
+allowed_formats = [".flac", ".ogg"]
+
+
+def parse_entries(files) -> List[Dict]:
+    entries = []
+    for file in files:
+        if file["source"] == "original":
+            allowed = False
+            for ext in allowed_formats:
+                if file["name"].endswith(ext):
+                    allowed = True
+                    break
+            if allowed:
+                entry = os.path.splitext(file["name"])[0].split(" - ", 1)
+                # we should maybe convert artist to username in here and send that along?
+                # but maybe more chances to go wrong
+                entries.append({"artist": entry[0], "track": entry[1], "filename": file["name"]})
+
+    return entries
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# one session for all fetches, so connections to archive.org are pooled and kept alive
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            # slow to import, and only needed when the cache misses
+            import internetarchive
+            _session = internetarchive.get_session(http_adapter_kwargs={"pool_maxsize": c.archive_pool_size})
+    return _session
+
+
+def fetch_entries(identifier) -> List[Dict]:
+    try:
+        with metrics.archive_get_item.time():
+            item = get_session().get_item(identifier, request_kwargs={"timeout": c.archive_timeout})
+    except Exception:
+        metrics.archive_get_item_errors.inc()
+        raise
+    return parse_entries(item.files)
+
+
+# ttl cache of the parsed entry lists, keyed by archive identifier
+#
+# - fresh values (younger than ttl) are returned as they are
+# - stale values (younger than ttl + stale_ttl) are returned too, but trigger a background refresh
+# - anything older is a miss and blocks on the upstream fetch
+# - permanent values (closed events) never expire
+#
+# concurrent misses on the same identifier share a single upstream fetch.
+# with a disk_path, values are also persisted there so they survive restarts and are shared between workers
+class EntriesCache:
+    def __init__(self, fetch=fetch_entries, ttl=300, stale_ttl=3600, disk_path=None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.disk_path = disk_path
+
+        # identifier -> {"entries": [...], "fetched_at": float, "permanent": bool}
+        self._values = {}
+        # identifier -> Future of the running upstream fetch
+        self._inflight = {}
+        # running fetches of get_async()
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+        self.counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "upstream_fetches": 0,
+            "upstream_errors": 0,
+        }
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["cached"] = len(self._values)
+        return stats
+
+    def _disk_file(self, identifier):
+        return os.path.join(self.disk_path, identifier + ".json")
+
+    def _read_disk(self, identifier):
+        if not self.disk_path:
+            return None
+        try:
+            with open(self._disk_file(identifier), "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_disk(self, identifier, value):
+        if not self.disk_path:
+            return
+        os.makedirs(self.disk_path, exist_ok=True)
+        # write and rename, so other workers never read a partial file
+        tmp_file = f"{self._disk_file(identifier)}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(value, file)
+        os.replace(tmp_file, self._disk_file(identifier))
+
+    def _age(self, value):
+        if value["permanent"]:
+            return 0
+        return time.time() - value["fetched_at"]
+
+    def _cached(self, identifier):
+        value = self._values.get(identifier)
+        if value is None:
+            value = self._read_disk(identifier)
+            if value is not None:
+                self.count("disk_hits")
+                self._values[identifier] = value
+        return value
+
+    # the entries if they can be served from the cache, None if they have to be fetched.
+    # stale entries are returned, and refreshed in the background
+    def lookup(self, identifier, permanent=False) -> Optional[List[Dict]]:
+        value = self._cached(identifier)
+
+        if value is not None:
+            if permanent and not value["permanent"]:
+                # the event has closed since we cached it
+                value["permanent"] = True
+                self._write_disk(identifier, value)
+
+            age = self._age(value)
+            if age < self.ttl:
+                self.count("hits")
+                return value["entries"]
+            if age < self.ttl + self.stale_ttl:
+                self.count("stale_hits")
+                self.refresh(identifier, permanent, wait=False)
+                return value["entries"]
+
+        self.count("misses")
+        return None
+
+    # the cached entries however old they are, for when fetching fails. None if there are none
+    def last_known(self, identifier) -> Optional[List[Dict]]:
+        value = self._cached(identifier)
+        return value["entries"] if value is not None else None
+
+    def store(self, identifier, entries, permanent=False):
+        value = {"entries": entries, "fetched_at": time.time(), "permanent": permanent}
+        self._values[identifier] = value
+        self._write_disk(identifier, value)
+
+    # for when fetching failed, inside the except: the cached entries however old they are,
+    # better to serve an old list than nothing. re-raises the error if there are none
+    def fallback(self, identifier) -> List[Dict]:
+        entries = self.last_known(identifier)
+        if entries is None:
+            raise
+        return entries
+
+    def get(self, identifier, permanent=False) -> List[Dict]:
+        entries = self.lookup(identifier, permanent)
+        if entries is not None:
+            return entries
+
+        try:
+            return self.refresh(identifier, permanent)
+        except Exception:
+            return self.fallback(identifier)
+
+    # the same as get() for the async front (asgi.py), with fetch a coroutine function.
+    # async and sync callers share the same single-flight fetches
+    async def get_async(self, identifier, permanent, fetch) -> List[Dict]:
+        entries = self.lookup(identifier, permanent)
+        if entries is not None:
+            return entries
+
+        future, leader = self._join_fetch(identifier)
+        if leader:
+            task = asyncio.ensure_future(self._run_fetch_async(identifier, permanent, future, fetch))
+            # the loop only keeps a weak reference to its tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        try:
+            # shielded, so that a client going away doesn't cancel the fetch of the others
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except Exception:
+            return self.fallback(identifier)
+
+    # the Future of the running upstream fetch of an identifier, and whether the caller has to run it
+    def _join_fetch(self, identifier):
+        with self._lock:
+            future = self._inflight.get(identifier)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[identifier] = future
+        return future, leader
+
+    # fetches upstream, joining the fetch that is already running for this identifier if any
+    def refresh(self, identifier, permanent=False, wait=True) -> List[Dict]:
+        future, leader = self._join_fetch(identifier)
+
+        if leader:
+            if wait:
+                self._run_fetch(identifier, permanent, future)
+            else:
+                threading.Thread(
+                    target=self._run_fetch, args=(identifier, permanent, future), daemon=True
+                ).start()
+
+        if wait:
+            return future.result()
+        return None
+
+    def _run_fetch(self, identifier, permanent, future):
+        self.count("upstream_fetches")
+        try:
+            entries = self.fetch(identifier)
+            self.store(identifier, entries, permanent)
+            future.set_result(entries)
+        except Exception as e:
+            self.count("upstream_errors")
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[identifier]
+
+    async def _run_fetch_async(self, identifier, permanent, future, fetch):
+        self.count("upstream_fetches")
+        try:
+            entries = await fetch(identifier)
+            self.store(identifier, entries, permanent)
+            future.set_result(entries)
+        except Exception as e:
+            self.count("upstream_errors")
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[identifier]
+
+    def invalidate(self, identifier):
+        self._values.pop(identifier, None)
+        if self.disk_path:
+            try:
+                os.remove(self._disk_file(identifier))
+            except FileNotFoundError:
+                pass
+
+
+entries_cache = EntriesCache(
+    ttl=c.entries_cache_ttl,
+    stale_ttl=c.entries_cache_stale_ttl,
+    disk_path=c.entries_cache_path,
+)
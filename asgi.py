@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# async front of the app, so that waiting for archive.org doesn't hold a worker
+#
+#   pipenv run gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+#   pipenv run uvicorn asgi:app
+#
+# /get_entries/<id> is answered here. events with an entry manifest (see ingest.py) are answered
+# from it, the others from archive.entries_cache, whose misses await archive.org through a pooled
+# keep-alive client, while other requests keep being served.
+# /load_current_entries awaits the entries of the voting event the same way, and hands them to the
+# flask view with server.prefetched_entries.
+# every other request goes to the flask app in server.py, as it is, on a pool of c.asgi_threads threads.
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import httpx
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+import common as c
+import catalog
+import archive
+import ingest
+import metrics
+import server
+import voting
+
+
+metadata_url = "https://archive.org/metadata/{}"
+
+get_entries_path = re.compile(r"/get_entries/(\d+)")
+current_entries_path = "/load_current_entries"
+
+wsgi_threads = ThreadPoolExecutor(max_workers=c.asgi_threads, thread_name_prefix="wsgi")
+
+
+# WsgiToAsgi runs the app thread_sensitive, which puts every request on the same thread,
+# one after the other
+class ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.__dict__["run_wsgi_app"].func, thread_sensitive=False, executor=wsgi_threads
+    )
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+wsgi_app = ThreadPoolWsgiToAsgi(server.app)
+
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=c.archive_timeout,
+            limits=httpx.Limits(max_connections=c.archive_pool_size, max_keepalive_connections=c.archive_pool_size),
+        )
+    return _client
+
+
+# the same as archive.fetch_entries: get_item reads the file list from the metadata api
+async def fetch_entries(identifier) -> List[Dict]:
+    try:
+        with metrics.archive_get_item.time():
+            response = await get_client().get(metadata_url.format(identifier))
+            response.raise_for_status()
+            files = response.json().get("files", [])
+    except Exception:
+        metrics.archive_get_item_errors.inc()
+        raise
+    return archive.parse_entries(files)
+
+
+async def send_response(send, status, body: bytes, content_type):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# the manifest if there is one, otherwise archive.org
+async def event_entries(event: catalog.Event) -> List[Dict]:
+    entries = ingest.get_manifest_entries(event.id)
+    if entries is None:
+        entries = await archive.entries_cache.get_async(event.archive, event.closed, fetch_entries)
+    return entries
+
+
+# same responses as server.get_entries
+async def entries_endpoint(event_id, send) -> int:
+    event = catalog.get_event(event_id)
+    if event is None:
+        await send_response(send, 200, b"Invalid event ID", "text/html; charset=utf-8")
+        return 200
+
+    try:
+        entries = await event_entries(event)
+    except Exception:
+        await send_response(send, 500, b"Internal Server Error", "text/plain; charset=utf-8")
+        return 500
+
+    # serialised by flask, so the body is the same
+    with server.app.app_context():
+        response = server.app.json.response(entries)
+    await send_response(send, 200, response.get_data(), response.content_type)
+    return 200
+
+
+async def lifespan(receive, send):
+    global _client
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _client is not None:
+                await _client.aclose()
+                _client = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+# the page is rendered by flask, with the entries awaited here
+async def current_entries_endpoint(scope, receive, send):
+    event = catalog.get_event(voting.get_voting_state().event_id)
+    if event is not None:
+        try:
+            server.prefetched_entries.set((event.id, await event_entries(event)))
+        except Exception:
+            # flask tries again, and answers the error as it always did
+            pass
+    await wsgi_app(scope, receive, send)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    if scope["type"] == "http" and scope["method"] == "GET":
+        match = get_entries_path.fullmatch(scope["path"])
+        if match:
+            started = time.perf_counter()
+            status = await entries_endpoint(int(match.group(1)), send)
+            metrics.request_duration.observe(
+                time.perf_counter() - started, "/get_entries/<int:event_id>", "GET", str(status)
+            )
+            return
+
+        if scope["path"] == current_entries_path:
+            await current_entries_endpoint(scope, receive, send)
+            return
+
+    await wsgi_app(scope, receive, send)
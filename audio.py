@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+# offline analysis of submitted audio files: duration, sample peak, rms and integrated loudness
+#
+# files are decoded in chunks of c.audio_chunk_frames, so memory stays the same for any length.
+# loudness follows ITU-R BS.1770-4 (k-weighting, 400ms blocks, absolute and relative gates),
+# with all channels weighed the same, which is right for mono and stereo.
+# the k-weighting filters are applied as an FIR of their impulse response, by fft convolution,
+# so that everything is done with numpy on whole chunks.
+#
+# decoding needs the soundfile package (libsndfile), imported only here.
+#
+# usage:
+#   audio.py <file>...    print the analysis of the files
+#   (ingest.py analyze adds the analysis of every entry to the manifest)
+
+import sys
+import json
+import math
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+import common as c
+
+
+block_seconds = 0.4
+# blocks overlap by 75%, so they are made of 4 steps
+block_steps = 4
+absolute_gate = -70.0
+relative_gate = -10.0
+
+# length of the k-weighting impulse response. it has decayed far below -100 dB by then
+fir_seconds = 0.2
+
+
+def db(value: float):
+    # + 0.0 turns -0.0 into 0.0
+    return round(20 * math.log10(value), 2) + 0.0 if value > 0 else None
+
+
+# ========================================
+# k-weighting
+
+# (b, a) of the two biquads of BS.1770 for a sample rate. the 48kHz coefficients of the standard,
+# derived for any rate as libebur128 does
+def k_weighting_biquads(rate: int):
+    # high shelf
+    f0 = 1681.974450955533
+    gain = 3.999843853973347
+    q = 0.7071752369554196
+    k = math.tan(math.pi * f0 / rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (
+        [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0],
+        [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0],
+    )
+
+    # high pass
+    f0 = 38.13547087602444
+    q = 0.5003270373238773
+    k = math.tan(math.pi * f0 / rate)
+    a0 = 1 + k / q + k * k
+    highpass = ([1.0, -2.0, 1.0], [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+
+    return [shelf, highpass]
+
+
+def biquad(b, a, signal: List[float]) -> List[float]:
+    output = []
+    x1 = x2 = y1 = y2 = 0.0
+    for x in signal:
+        y = b[0] * x + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+        x2, x1, y2, y1 = x1, x, y1, y
+        output.append(y)
+    return output
+
+
+def k_weighting_fir(rate: int) -> numpy.ndarray:
+    response = [1.0] + [0.0] * (int(fir_seconds * rate) - 1)
+    for b, a in k_weighting_biquads(rate):
+        response = biquad(b, a, response)
+    return numpy.array(response)
+
+
+# ========================================
+# analysis
+
+# streams chunks of frames x channels through the measurements
+class Analyzer:
+    def __init__(self, rate: int, channels: int):
+        self.rate = rate
+        self.frames = 0
+        self.peak = 0.0
+        self.sum_squares = 0.0
+
+        self.fir = k_weighting_fir(rate)
+        # fft size -> spectrum of the fir
+        self.fir_spectra = {}
+        # the end of the previous chunk, needed by the convolution
+        self.history = numpy.zeros((len(self.fir) - 1, channels))
+        self.step_frames = round(rate * block_seconds / block_steps)
+        # k-weighted frames not making a whole step yet
+        self.pending = numpy.zeros((0, channels))
+        # mean square of the k-weighted signal of each step, summed over the channels
+        self.step_powers = []
+
+    def add(self, chunk: numpy.ndarray):
+        chunk = chunk.astype(numpy.float64)
+        self.frames += len(chunk)
+        self.peak = max(self.peak, float(numpy.abs(chunk).max(initial=0)))
+        self.sum_squares += float(numpy.square(chunk).sum())
+
+        # linear convolution of history + chunk with the fir, keeping the len(chunk) valid outputs
+        signal = numpy.concatenate([self.history, chunk])
+        size = 1 << (len(signal) + len(self.fir) - 1).bit_length()
+        if size not in self.fir_spectra:
+            self.fir_spectra[size] = numpy.fft.rfft(self.fir, size)[:, None]
+        spectrum = numpy.fft.rfft(signal, size, axis=0) * self.fir_spectra[size]
+        weighted = numpy.fft.irfft(spectrum, size, axis=0)[len(self.history):len(signal)]
+        self.history = signal[len(signal) - len(self.history):]
+
+        weighted = numpy.concatenate([self.pending, weighted])
+        steps = len(weighted) // self.step_frames
+        stepped = weighted[:steps * self.step_frames].reshape(steps, self.step_frames, -1)
+        self.step_powers.extend(numpy.square(stepped).mean(axis=1).sum(axis=1).tolist())
+        self.pending = weighted[steps * self.step_frames:]
+
+    def integrated_loudness(self):
+        powers = numpy.array(self.step_powers)
+        if len(powers) < block_steps:
+            return None
+
+        # the mean over the 4 steps of each block, blocks starting at every step
+        cumulative = numpy.concatenate([[0.0], numpy.cumsum(powers)])
+        blocks = (cumulative[block_steps:] - cumulative[:-block_steps]) / block_steps
+
+        with numpy.errstate(divide="ignore"):
+            loudness = -0.691 + 10 * numpy.log10(blocks)
+        gated = blocks[loudness > absolute_gate]
+        if len(gated) == 0:
+            return None
+        threshold = -0.691 + 10 * math.log10(gated.mean()) + relative_gate
+        gated = blocks[(loudness > absolute_gate) & (loudness > threshold)]
+        return round(-0.691 + 10 * math.log10(gated.mean()), 2)
+
+    def result(self) -> Dict:
+        samples = self.frames * self.history.shape[1]
+        return {
+            "duration": round(self.frames / self.rate, 3),
+            "sample_rate": self.rate,
+            "channels": self.history.shape[1],
+            "peak_dbfs": db(self.peak),
+            "rms_dbfs": db(math.sqrt(self.sum_squares / samples)) if samples else None,
+            "loudness_lufs": self.integrated_loudness(),
+        }
+
+
+# (measurement, limit in c.audio_limits, whether it's a maximum, message)
+checks = [
+    ("duration", "max_duration", True, "longer than {}s"),
+    ("duration", "min_duration", False, "shorter than {}s"),
+    ("peak_dbfs", "max_peak_dbfs", True, "peak above {} dBFS, probably clipping"),
+    ("loudness_lufs", "max_loudness_lufs", True, "louder than {} LUFS"),
+    ("loudness_lufs", "min_loudness_lufs", False, "quieter than {} LUFS"),
+]
+
+
+# what breaks the limits of c.audio_limits
+def check_limits(analysis: Dict) -> List[str]:
+    if analysis["peak_dbfs"] is None:
+        return ["silent"]
+
+    flags = []
+    for measurement, limit_name, is_max, message in checks:
+        value = analysis[measurement]
+        limit = c.audio_limits.get(limit_name)
+        if value is None or limit is None:
+            continue
+        if (value > limit) if is_max else (value < limit):
+            flags.append(message.format(limit))
+    return flags
+
+
+# runs in worker processes. decoding errors end up in the flags rather than stopping the others
+def analyze_file(path) -> Dict:
+    import soundfile
+
+    try:
+        info = soundfile.info(path)
+        analyzer = Analyzer(info.samplerate, info.channels)
+        for chunk in soundfile.blocks(path, blocksize=c.audio_chunk_frames, dtype="float32", always_2d=True):
+            analyzer.add(chunk)
+    except Exception as e:
+        return {"flags": [f"can't be decoded: {e}"]}
+
+    analysis = analyzer.result()
+    analysis["flags"] = check_limits(analysis)
+    return analysis
+
+
+def analyze_files(paths: List[str], jobs=None) -> List[Dict]:
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(analyze_file, paths))
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        print("usage: audio.py <file>...")
+        sys.exit(1)
+
+    for path, analysis in zip(paths, analyze_files(paths)):
+        print(path)
+        print(json.dumps(analysis, indent=4))
+
+
+if __name__ == "__main__":
+    main()
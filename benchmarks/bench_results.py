@@ -0,0 +1,19 @@
+import registry
+import results
+
+
+def bench_generate_results(benchmark, synthetic_tree):
+    # the last closed event
+    event_id = synthetic_tree.current_event - 1
+
+    scoreboard = benchmark(results.generate_results, event_id, missing="disqualify", overwrite="yes")
+    assert len(scoreboard) == len(synthetic_tree.participants[event_id])
+
+
+def bench_vote_matrix(benchmark, synthetic_tree):
+    users = registry.get()
+    event_id = synthetic_tree.current_event - 1
+    ballots = results.journal.get_vote_journal().get_event_votes(event_id)
+    usernames = [users.artist_to_username(a) for a in synthetic_tree.participants[event_id]]
+
+    benchmark(results.VoteMatrix, ballots, usernames, users.artists)
@@ -0,0 +1,60 @@
+import itertools
+import archive
+import respcache
+
+
+def bench_save_votes(benchmark, voter_client, synthetic_tree):
+    artists = synthetic_tree.participants[synthetic_tree.current_event]
+    # every post changes all the votes, so that each one is written
+    forms = itertools.cycle([
+        {f"vote_{artist}": str(vote) for artist in artists} for vote in (1, 2, 3, 4, 5)
+    ])
+
+    response = benchmark(lambda: voter_client.post("/save_votes", data=next(forms)))
+    assert response.status_code == 200
+
+
+def bench_get_user_votes(benchmark, voter_client, synthetic_tree):
+    url = f"/get_my_votes/{synthetic_tree.current_event}"
+
+    response = benchmark(voter_client.post, url)
+    assert response.status_code == 200
+
+
+def bench_events_page(benchmark, client):
+    response = benchmark(client.get, "/events")
+    assert response.status_code == 200
+
+
+def bench_events_page_uncached(benchmark, client):
+    response = benchmark.pedantic(client.get, args=("/events",), setup=respcache._pages.clear, rounds=20)
+    assert response.status_code == 200
+
+
+def bench_rss(benchmark, client):
+    response = benchmark(client.get, "/rss")
+    assert response.status_code == 200
+
+
+def bench_rss_uncached(benchmark, client):
+    response = benchmark.pedantic(client.get, args=("/rss",), setup=respcache._pages.clear, rounds=20)
+    assert response.status_code == 200
+
+
+def bench_get_entries(benchmark, client, synthetic_tree):
+    url = f"/get_entries/{synthetic_tree.current_event}"
+
+    response = benchmark(client.get, url)
+    assert len(response.json) == len(synthetic_tree.participants[synthetic_tree.current_event])
+
+
+# every request misses the cache and goes to the (stubbed) archive
+def bench_get_entries_uncached(benchmark, client, synthetic_tree):
+    event_id = synthetic_tree.current_event
+    identifier = f"synthetic-challenge-{event_id}"
+
+    response = benchmark.pedantic(
+        client.get, args=(f"/get_entries/{event_id}",),
+        setup=lambda: archive.entries_cache.invalidate(identifier), rounds=50,
+    )
+    assert response.status_code == 200
@@ -0,0 +1,25 @@
+import os
+import sys
+import json
+import subprocess
+
+
+startup_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup.py")
+
+
+# a fresh interpreter each round: imports the app and makes the first requests.
+# the split between import and each request is in the extra info of the saved json
+def bench_cold_start(benchmark, synthetic_tree):
+    runs = []
+
+    def cold_start():
+        output = subprocess.run(
+            [sys.executable, startup_script], cwd=synthetic_tree.root,
+            capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output))
+
+    benchmark.pedantic(cold_start, rounds=5, warmup_rounds=1)
+
+    for key in runs[0]:
+        benchmark.extra_info[key] = min(run[key] for run in runs)
@@ -0,0 +1,76 @@
+# fixtures of the benchmark suite
+#
+# the benchmarks run on a synthetic tree (see synthetic.py) in a temporary directory,
+# with archive.org replaced by the synthetic entry lists.
+# the size is set with LMC_BENCH_SCALE: small (default), medium or large
+
+import os
+import sys
+from typing import NamedTuple, Dict, List
+import pytest
+
+# the app modules are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+
+
+scale = os.environ.get("LMC_BENCH_SCALE", "small")
+
+
+class SyntheticTree(NamedTuple):
+    root: str
+    # username -> artist
+    users: Dict[str, str]
+    # event id -> artists
+    participants: Dict[int, List[str]]
+    # the running event
+    current_event: int
+
+
+@pytest.fixture(scope="session")
+def synthetic_tree(tmp_path_factory):
+    voters, entries, events = synthetic.scales[scale]
+    root = str(tmp_path_factory.mktemp("lmc"))
+    users, participants = synthetic.generate(root, voters, entries, events)
+
+    # all paths in common.py are relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(root)
+    yield SyntheticTree(root, users, participants, events)
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope="session")
+def app(synthetic_tree):
+    import archive
+
+    def fetch_entries(identifier):
+        event_id = int(identifier.rsplit("-", 1)[1])
+        return archive.parse_entries(synthetic.archive_files(event_id, synthetic_tree.participants[event_id]))
+
+    archive.entries_cache.fetch = fetch_entries
+
+    import server
+    import winners
+    # so that /events doesn't start resolving them in the background
+    winners.resolve_missing()
+
+    return server.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# logged in as a participant of the running event
+@pytest.fixture(scope="session")
+def voter_client(app, synthetic_tree):
+    artist = synthetic_tree.participants[synthetic_tree.current_event][0]
+    username = next(u for u, a in synthetic_tree.users.items() if a == artist)
+
+    client = app.test_client()
+    response = client.post("/login", data={"username": username, "password": synthetic.password})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+# cold start of a worker: time to import the app, then the first request of a few pages.
+# prints json. runs in the working directory, which must be a data tree (e.g. from synthetic.py)
+#
+# usage:
+#   startup.py [url ...]
+
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+default_urls = ["/", "/rules", "/rss"]
+
+
+def main():
+    urls = sys.argv[1:] or default_urls
+
+    started = time.perf_counter()
+    import server
+    timings = {"import": time.perf_counter() - started}
+
+    client = server.app.test_client()
+    for url in urls:
+        started = time.perf_counter()
+        response = client.get(url)
+        timings[url] = time.perf_counter() - started
+        assert response.status_code == 200, f"{url}: {response.status_code}"
+
+    print(json.dumps(timings))
+
+
+if __name__ == "__main__":
+    main()
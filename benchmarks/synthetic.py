@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# synthetic challenge data, laid out like the real tree so the app can run on it
+#
+#   data/events.csv, data/participants.yaml, data/users.yaml, data/rules.md
+#   storage/votes/lmcN.json   tinydb shards, one ballot per voter
+#   storage/users.json        every user registered, all with the same password
+#   storage/current_voting_event, secret/
+#
+# every event but the last is closed. the last one is the running event, with voting open.
+# each voter votes for every entry of every event except their own.
+#
+# usage:
+#   synthetic.py <output dir> [small|medium|large] [voters=N] [entries=N] [events=N] [seed=N]
+
+import os
+import sys
+import csv
+import json
+import random
+from datetime import date
+import yaml
+from werkzeug.security import generate_password_hash
+
+
+# (voters, entries, events)
+scales = {
+    "small": (50, 20, 10),
+    "medium": (200, 60, 40),
+    "large": (500, 200, 100),
+}
+
+password = "synthetic"
+admin_user = "user0000"
+
+events_header = ["date", "id", "title", "challenge", "entries", "winner", "link", "archive",
+                 "forum replies", "forum views"]
+
+
+def username(i: int) -> str:
+    return f"user{i:04d}"
+
+
+def artist(i: int) -> str:
+    return f"Artist {i:04d}"
+
+
+def archive_identifier(event_id: int) -> str:
+    return f"synthetic-challenge-{event_id}"
+
+
+def track(event_id: int, artist_name: str) -> str:
+    return f"Track {event_id} by {artist_name}"
+
+
+# the archive files of an event, as internetarchive lists them
+def archive_files(event_id: int, participants):
+    files = [{"name": f"{a} - {track(event_id, a)}.flac", "source": "original"} for a in participants]
+    files.append({"name": f"{archive_identifier(event_id)}_files.xml", "source": "original"})
+    return files
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(data, file)
+
+
+def generate(root, voters=50, entries=20, events=10, seed=0):
+    rng = random.Random(seed)
+    entries = min(entries, voters)
+
+    users = {username(i): artist(i) for i in range(voters)}
+    usernames = list(users)
+
+    participants = {}
+    for event_id in range(1, events + 1):
+        participants[event_id] = [users[u] for u in sorted(rng.sample(usernames, entries))]
+
+    os.makedirs(os.path.join(root, "data", "results"), exist_ok=True)
+    with open(os.path.join(root, "data", "users.yaml"), "w") as file:
+        yaml.safe_dump({"users": users}, file, allow_unicode=True)
+    with open(os.path.join(root, "data", "participants.yaml"), "w") as file:
+        yaml.safe_dump(participants, file, allow_unicode=True)
+    with open(os.path.join(root, "data", "rules.md"), "w") as file:
+        file.write("## General\n\n" + "".join(f"- rule number {i}\n" for i in range(20)))
+
+    with open(os.path.join(root, "data", "events.csv"), "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(events_header)
+        for event_id in range(1, events + 1):
+            month = event_id - 1
+            event_date = date(2020 + month // 12, month % 12 + 1, 1)
+            winner = "?" if event_id == events else rng.choice(participants[event_id])
+            writer.writerow([
+                event_date.strftime("%d/%m/%y"), event_id, f"Synthetic challenge {event_id}",
+                f"only sounds made with instrument {event_id}", entries, winner,
+                f"https://example.org/viewtopic.php?p={event_id}", archive_identifier(event_id),
+                rng.randint(0, 100), rng.randint(1000, 10000),
+            ])
+
+    # tinydb shards, written directly: inserting through tinydb rewrites the file every time
+    for event_id in range(1, events + 1):
+        ballots = {}
+        for doc_id, user in enumerate(rng.sample(usernames, len(usernames)), start=1):
+            votes = {a: str(rng.randint(1, 5)) for a in participants[event_id] if a != users[user]}
+            ballots[str(doc_id)] = {"user": user, "votes": votes}
+        write_json(os.path.join(root, "storage", "votes", f"lmc{event_id}.json"), {"_default": ballots})
+
+    password_hash = generate_password_hash(password)
+    write_json(os.path.join(root, "storage", "users.json"), {"_default": {
+        str(i): {"username": u, "password": password_hash} for i, u in enumerate(usernames, start=1)
+    }})
+
+    with open(os.path.join(root, "storage", "current_voting_event"), "w") as file:
+        file.write(f"{events}\n1\n")
+
+    os.makedirs(os.path.join(root, "secret"), exist_ok=True)
+    with open(os.path.join(root, "secret", "secret_key"), "w") as file:
+        file.write(f"synthetic-{seed}\n")
+    with open(os.path.join(root, "secret", "admin_user"), "w") as file:
+        file.write(admin_user + "\n")
+
+    return users, participants
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print("usage: synthetic.py <output dir> [small|medium|large] [voters=N] [entries=N] [events=N] [seed=N]")
+        sys.exit(1)
+
+    root = args[0]
+    voters, entries, events = scales["small"]
+    options = {}
+    for arg in args[1:]:
+        if arg in scales:
+            voters, entries, events = scales[arg]
+        else:
+            key, value = arg.split("=", 1)
+            options[key] = int(value)
+
+    generate(
+        root,
+        voters=options.get("voters", voters),
+        entries=options.get("entries", entries),
+        events=options.get("events", events),
+        seed=options.get("seed", 0),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import csv
+from datetime import datetime
+from typing import List, Dict, Optional
+import common as c
+import metrics
+
+
+# one row of events.csv, with the date already parsed
+class Event:
+    __slots__ = (
+        "id",
+        "date",
+        "month_year",
+        "title",
+        "challenge",
+        "entries",
+        "winner",
+        "link",
+        "archive",
+        "forum_replies",
+        "forum_views",
+    )
+
+    def __init__(self, row: Dict):
+        self.id = int(row["id"])
+        self.date = datetime.strptime(row["date"], "%d/%m/%y")
+        self.month_year = self.date.strftime("%B %Y")
+        self.title = row["title"]
+        self.challenge = row["challenge"]
+        self.entries = row["entries"]
+        self.winner = row["winner"]
+        self.link = row["link"]
+        self.archive = row["archive"]
+        self.forum_replies = row["forum replies"]
+        self.forum_views = row["forum views"]
+
+    # the entry list and results of an event can't change anymore once the winner is announced
+    @property
+    def closed(self) -> bool:
+        return self.winner not in ("", "?")
+
+    def to_dict(self) -> Dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self):
+        return f"Event({self.id}, {self.title!r})"
+
+
+class EventCatalog:
+    def __init__(self, path):
+        self._cache = c.FileCache(lambda: self._load(path), [path])
+
+    def _load(self, path):
+        events = []
+        with open(path, "r") as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                events.append(Event(row))
+        metrics.csv_parses.inc(path)
+
+        # (list in file order, index by id)
+        return events, {e.id: e for e in events}
+
+    def all(self) -> List[Event]:
+        return self._cache.get()[0]
+
+    def get(self, event_id: int) -> Optional[Event]:
+        return self._cache.get()[1].get(int(event_id))
+
+
+event_catalog = EventCatalog(c.events_datafile)
+
+
+def get_events() -> List[Event]:
+    return event_catalog.all()
+
+
+def get_event(event_id: int) -> Optional[Event]:
+    return event_catalog.get(event_id)
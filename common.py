@@ -1,11 +1,29 @@
 #!/usr/bin/env python3
 
-from tinydb import TinyDB
 import yaml
+import metrics
+import os
+import threading
+import time
 
+# "tinydb" (users_db and votes_shards_path json files) or "sqlite" (sqlite_db). see storage.py
+storage_backend = os.environ.get("LMC_STORAGE", "tinydb")
 users_db = "storage/users.json"
+# one tinydb file per event
+votes_shards_path = "storage/votes/"
+# the old single file with all events, only used to split it into shards
 votes_db = "storage/votes.json"
+sqlite_db = "storage/lmc.sqlite3"
+# vote changes are appended here and folded into the storage on compaction. see journal.py
+vote_journal = "storage/votes-journal.jsonl"
+vote_journal_fsync_batch = 32
+vote_journal_fsync_interval = 1.0
+vote_journal_compact_size = 4 * 1024 * 1024
+# manual override of the voting schedule. see voting.py
 current_voting_event_statusfile = "storage/current_voting_event"
+# days of the month after the challenge when voting opens and gets locked
+voting_open_day = 1
+voting_lock_day = 16
 
 events_datafile = "data/events.csv"
 rules_md = "data/rules.md"
@@ -13,56 +31,135 @@ event_participants = "data/participants.yaml"
 users_table = "data/users.yaml"
 
 results_path = "data/results/"
+# hashes of the inputs each event's results were last generated from. see results.py batch
+results_hashes_file = "storage/results-hashes.json"
+# spreadsheet formats written by results.py: ods, csv and/or jsonl. see results_export.py
+results_formats = ["ods"]
+# also compute the alternative rankings of analytics.py: a rankings sheet and lmcN-rankings.json
+results_analytics = False
+
+# votes of all the closed events in one array, see history.py
+history_path = "storage/history/"
+# voters with fewer entries in common than this have no similarity
+history_min_common = 5
+
+# also serve /metrics without logging in to requests from localhost, for a prometheus on the same host.
+# leave it off behind a reverse proxy on the same host, every request would look local
+metrics_allow_localhost = False
+
+# profiling of requests, off unless LMC_PROFILE is set. see profiler.py
+profile_enabled = os.environ.get("LMC_PROFILE", "") not in ("", "0")
+# fraction of all requests that get profiled, on top of the ones asked for by the admin with ?profile
+profile_sample_rate = float(os.environ.get("LMC_PROFILE_SAMPLE_RATE", "0"))
+profile_path = "storage/profiles/"
+
+# jinja bytecode cache of the compiled templates
+jinja_cache_path = "storage/cache/jinja"
+
+# static export of the public pages. see export.py
+export_path = "build/"
+
+# archive.org entry lists: seconds before a list is refreshed, and for how long after that
+# a stale list can still be served while refreshing in the background
+entries_cache_ttl = 300
+entries_cache_stale_ttl = 3600
+# set to None to disable the on-disk tier
+entries_cache_path = "storage/cache/entries"
+
+# seconds before a request to archive.org gives up, and connections kept open to it per process
+archive_timeout = 10
+archive_pool_size = 10
+
+# threads running the flask app behind the async front of asgi.py, per process
+asgi_threads = 20
+
+# entry lists built from the submission folders by ingest.py, served instead of asking archive.org
+entries_manifest_path = "data/entries/"
+
+# frames decoded at a time by audio.py
+audio_chunk_frames = 65536
+# what audio.py flags in the submissions. None turns a check off. the rules have no length limit
+audio_limits = {
+    "max_duration": None,
+    "min_duration": None,
+    "max_peak_dbfs": -0.1,
+    "max_loudness_lufs": -6.0,
+    "min_loudness_lufs": -30.0,
+}
+
+# archive filenames of the winning entries, resolved by winners.py
+winner_entries_file = "storage/winner_entries.json"
+
+
+def file_mtime(path):
+    # None for missing files, so that a file appearing also counts as a change
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+# holds a value built from one or more source files
+# the value is rebuilt by calling loader() only when the mtime of any source changes
+# paths can also be a callable returning the list of paths, for globbed sources
+# with check_interval, the mtimes are checked at most once every check_interval seconds,
+# unless get(fresh=True) asks for them to be checked now
+class FileCache:
+    def __init__(self, loader, paths, check_interval=0):
+        self.loader = loader
+        self.paths = paths
+        self.check_interval = check_interval
+        self._stamp = None
+        self._checked_at = 0
+        self._value = None
+        self._lock = threading.Lock()
+
+    def stamp(self):
+        paths = self.paths() if callable(self.paths) else self.paths
+        return tuple((path, file_mtime(path)) for path in paths)
+
+    def get(self, fresh=False):
+        if self.check_interval and self._stamp is not None and not fresh:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return self._value
+
+        stamp = self.stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._value = self.loader()
+                    self._stamp = stamp
+        self._checked_at = time.monotonic()
+        return self._value
+
+    def invalidate(self):
+        self._stamp = None
 
 
-def get_votes_db(event_id: int):
-    db = TinyDB(votes_db)
-    table = db.table(str(event_id))
-    # this call is required to setup the table in case it's empty (?)
-    table.all()
+def get_scoreboard_filename(event_id: int):
+    return f"{results_path}/lmc{event_id}-scoreboard.json"
 
-    return table
 
-# event = 0 in current_event file to disable voting and showing
-# locked = 1 to disable changing votes
-# eventually make it automatic depending on date
-def get_current_voting_event():
-    current_event = 0
+def get_entries_manifest_filename(event_id: int):
+    return f"{entries_manifest_path}/lmc{event_id}.json"
 
-    # with open("current_event", "r") as file:
-    #     contents = file.read()
-    #     current_event = int(contents.rstrip())
 
-    with open(current_voting_event_statusfile, "r") as file:
-        lines = [line.strip() for line in file.readlines()]
-        current_event = int(lines[0])
+def get_rankings_filename(event_id: int):
+    return f"{results_path}/lmc{event_id}-rankings.json"
 
-    return current_event
 
+# the libyaml loader is much faster, when pyyaml was built with it
+yaml_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-def is_voting_open():
-    open_status = 0
-    with open(current_voting_event_statusfile, "r") as file:
-        lines = [line.strip() for line in file.readlines()]
-        open_status = int(lines[1])
 
-    return open_status
+def load_yaml(path):
+    with open(path, 'r') as file:
+        data = yaml.load(file, Loader=yaml_loader)
+    metrics.yaml_parses.inc(path)
+    return data
 
 
+# parses the file on every call. registry.py keeps it parsed
 def get_users_table():
-    with open(users_table, 'r') as file:
-        data = yaml.safe_load(file)
-    return data['users']
-
-
-def get_available_usernames():
-    users = get_users_table()
-    return list(users.keys())
-
-
-def get_event_participants(event_id):
-    with open(event_participants, 'r') as file:
-        data = yaml.safe_load(file)
-
-    return data[event_id]
+    return load_yaml(users_table)['users']
 
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# renders the public pages into static files, so they can be served without flask
+#
+#   /               index.html
+#   /events         events.html
+#   /rules          rules.html
+#   /rss            rss.xml
+#   /results/<id>   results/<id>.html
+#
+# every file gets a .gz sibling. with nginx for example:
+#   gzip_static on;
+#   location / { try_files $uri $uri.html $uri.xml @flask; }
+# and everything else (/login, /vote, /save_votes, ...) proxied to flask in @flask
+#
+# results pages are only exported once the winner is announced, and /events shows the winner entries
+# that winners.py already resolved, without asking archive.org.
+# pages are only re-rendered when one of their source files changed since the last export,
+# so this is cheap enough to run after every commit (e.g. from a git post-commit hook)
+#
+# usage:
+#   export.py [output dir] [force]
+
+import sys
+import os
+import json
+import gzip
+import hashlib
+from typing import List, Tuple, Callable
+import common as c
+import catalog
+import server
+import winners
+
+
+manifest_filename = ".export-manifest.json"
+
+
+# [(url, output file, sources)]
+def get_pages() -> List[Tuple[str, str, Callable]]:
+    pages = [
+        ("/", "index.html", lambda: [server.template_path("index.html"), server.template_path("base.html")]),
+        ("/events", "events.html", server.events_sources),
+        ("/rules", "rules.html", server.rules_sources),
+        ("/rss", "rss.xml", server.rss_sources),
+    ]
+
+    for event in catalog.get_events():
+        # before the winner is announced, the page only says so
+        if event.closed and os.path.exists(c.get_scoreboard_filename(event.id)):
+            pages.append((
+                f"/results/{event.id}",
+                f"results/{event.id}.html",
+                lambda event_id=event.id: server.results_sources(event_id),
+            ))
+
+    return pages
+
+
+def fingerprint(paths) -> str:
+    sha = hashlib.sha1()
+    for path in paths:
+        sha.update(path.encode())
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                sha.update(file.read())
+        else:
+            sha.update(b"\0missing")
+    return sha.hexdigest()
+
+
+def write_if_changed(path, data: bytes) -> bool:
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            if file.read() == data:
+                return False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(path + ".tmp", path)
+    return True
+
+
+def export(output_path=c.export_path, force=False):
+    manifest_path = os.path.join(output_path, manifest_filename)
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path, "r") as file:
+            manifest = json.load(file)
+
+    # /events would resolve the missing winner entries from archive.org, in a thread the export doesn't wait for
+    winners.background_enabled = False
+    client = server.app.test_client()
+
+    for url, filename, sources in get_pages():
+        source_fingerprint = fingerprint(sources())
+        output_file = os.path.join(output_path, filename)
+
+        if manifest.get(url) == source_fingerprint and os.path.exists(output_file):
+            continue
+
+        response = client.get(url)
+        if response.status_code != 200:
+            print(f"{url}: error {response.status_code}, skipping")
+            continue
+
+        body = response.get_data()
+        changed = write_if_changed(output_file, body)
+        write_if_changed(output_file + ".gz", gzip.compress(body, compresslevel=9, mtime=0))
+        manifest[url] = source_fingerprint
+
+        print(f"{url}: {'written' if changed else 'unchanged'}")
+
+    os.makedirs(output_path, exist_ok=True)
+    with open(manifest_path, "w") as file:
+        json.dump(manifest, file, indent=4)
+
+
+def main():
+    args = sys.argv[1:]
+    force = "force" in args
+    args = [arg for arg in args if arg != "force"]
+
+    export(args[0] if args else c.export_path, force)
+
+
+if __name__ == "__main__":
+    main()
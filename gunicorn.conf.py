@@ -0,0 +1,19 @@
+# gunicorn settings, picked up automatically when running from this directory:
+#   pipenv run gunicorn server:app
+#
+# the app is imported once in the master process and the workers are forked from it,
+# so the modules, the parsed data files and the compiled templates are shared copy-on-write
+
+import os
+import multiprocessing
+
+bind = os.environ.get("LMC_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+preload_app = True
+
+
+# the app is loaded by now, and no worker has been forked yet
+def when_ready(server):
+    import server as lmc_server
+    lmc_server.preload()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+# the votes of every closed event since the first one with voting, packed into one
+# voters x artists x events array
+#
+# kept in c.history_path:
+#   index.json      the voters, artists and event ids along the axes, and the array file in use
+#   votes-N.npy     int8 votes, 0 where there is none. self votes are zeroed, they don't count
+#
+# the array is memory-mapped, so loading it doesn't read it, only the pages that are used.
+# it's updated incrementally: once an event closes (its winner is in events.csv), only the ballots
+# of the new events are read, the rest is copied from the previous array.
+# each update writes a new array file and then swaps index.json to it, so readers never see
+# a half written store.
+#
+# the analyses are computed on first use and cached along with the loaded store, until it changes
+#
+# usage:
+#   history.py build [force]          add the newly closed events, or rebuild everything with force
+#   history.py similar <user> [N]     the N voters who agree the most with a user (default 10)
+#   history.py generosity <user>      generosity of a voter, event by event
+#   history.py trend <artist>         average vote received by an artist, event by event
+
+import os
+import sys
+import json
+import fcntl
+import numpy
+from typing import Dict, List, Optional
+import common as c
+import catalog
+import journal
+import registry
+import results
+
+
+def index_file() -> str:
+    return os.path.join(c.history_path, "index.json")
+
+
+def read_index() -> Optional[Dict]:
+    if not os.path.exists(index_file()):
+        return None
+    with open(index_file(), "r") as file:
+        return json.load(file)
+
+
+def load_votes(index: Dict) -> numpy.ndarray:
+    shape = (len(index["voters"]), len(index["artists"]), len(index["events"]))
+    if 0 in shape:
+        return numpy.zeros(shape, dtype=numpy.int8)
+    return numpy.load(os.path.join(c.history_path, index["array"]), mmap_mode="r")
+
+
+# the events whose votes can't change anymore
+def closed_event_ids() -> List[int]:
+    return [e.id for e in catalog.get_events() if e.closed and e.id >= results.first_event]
+
+
+# adds the events closed since the last update, or rebuilds the whole store with force.
+# returns whether anything was written
+def update(force=False) -> bool:
+    os.makedirs(c.history_path, exist_ok=True)
+
+    # one update at a time, across processes
+    with open(os.path.join(c.history_path, "lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        index = None if force else read_index()
+        known_events = index["events"] if index else []
+        new_events = [e for e in closed_event_ids() if e not in known_events]
+        if index and not new_events:
+            return False
+
+        db = journal.get_vote_journal()
+        ballots = {event_id: db.get_event_votes(event_id) for event_id in new_events}
+
+        # new names go at the end, so that the old slices keep their coordinates
+        voters = list(index["voters"]) if index else []
+        artists = list(index["artists"]) if index else []
+        voter_index = {voter: i for i, voter in enumerate(voters)}
+        artist_index = {artist: i for i, artist in enumerate(artists)}
+        for event_ballots in ballots.values():
+            for ballot in event_ballots:
+                if ballot["user"] not in voter_index:
+                    voter_index[ballot["user"]] = len(voters)
+                    voters.append(ballot["user"])
+                for artist in ballot["votes"]:
+                    if artist not in artist_index:
+                        artist_index[artist] = len(artists)
+                        artists.append(artist)
+
+        events = sorted(known_events + new_events)
+        event_index = {event_id: i for i, event_id in enumerate(events)}
+
+        votes = numpy.zeros((len(voters), len(artists), len(events)), dtype=numpy.int8)
+        if index:
+            old = load_votes(index)
+            votes[:old.shape[0], :old.shape[1], [event_index[e] for e in known_events]] = old
+
+        users_table = registry.get().users
+        for event_id, event_ballots in ballots.items():
+            rows, cols, values = [], [], []
+            for ballot in event_ballots:
+                voter_artist = users_table.get(ballot["user"])
+                for artist, vote in ballot["votes"].items():
+                    if artist != voter_artist:
+                        rows.append(voter_index[ballot["user"]])
+                        cols.append(artist_index[artist])
+                        values.append(int(vote))
+            if values:
+                votes[rows, cols, event_index[event_id]] = values
+
+        generation = index["generation"] + 1 if index else 1
+        array_name = f"votes-{generation}.npy"
+        numpy.save(os.path.join(c.history_path, array_name), votes)
+
+        new_index = {
+            "generation": generation,
+            "array": array_name,
+            "voters": voters,
+            "artists": artists,
+            "events": events,
+        }
+        tmp_path = index_file() + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(new_index, file)
+        os.replace(tmp_path, index_file())
+
+        # readers that still have the old array mapped keep it until they reload
+        for filename in os.listdir(c.history_path):
+            if filename.startswith("votes-") and filename.endswith(".npy") and filename != array_name:
+                os.remove(os.path.join(c.history_path, filename))
+
+        return True
+
+
+# ========================================
+# analyses
+
+class VoteHistory:
+    def __init__(self, index: Dict, votes: numpy.ndarray):
+        self.voters = index["voters"]
+        self.artists = index["artists"]
+        self.events = index["events"]
+        self.voter_index = {voter: i for i, voter in enumerate(self.voters)}
+        self.artist_index = {artist: i for i, artist in enumerate(self.artists)}
+        # voters x artists x events
+        self.votes = votes
+        # name -> result of the analysis
+        self._results = {}
+
+    def _cached(self, name, compute):
+        if name not in self._results:
+            self._results[name] = compute()
+        return self._results[name]
+
+    # voters x voters pearson correlation of the votes two voters gave to the same entries.
+    # nan where they have less than c.history_min_common entries in common
+    def voter_similarity(self) -> numpy.ndarray:
+        return self._cached("voter_similarity", self._voter_similarity)
+
+    def _voter_similarity(self):
+        # every (artist, event) is an entry. most artists didn't take part in most events
+        x = self.votes.reshape(len(self.voters), -1)
+        x = x[:, (x > 0).any(axis=0)].astype(numpy.float32)
+        m = (x > 0).astype(numpy.float32)
+        x2 = x * x
+
+        # sums over the entries both voters voted for, for all pairs at once
+        n = m @ m.T
+        sx = x @ m.T
+        sxx = x2 @ m.T
+        sxy = x @ x.T
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            cov = n * sxy - sx * sx.T
+            var = (n * sxx - sx * sx) * (n * sxx - sx * sx).T
+            similarity = cov / numpy.sqrt(var)
+        similarity[(n < c.history_min_common) | ~(var > 0)] = numpy.nan
+        return similarity
+
+    # voters x events average vote given, nan where the voter didn't vote
+    def given(self) -> numpy.ndarray:
+        return self._cached("given", self._given)
+
+    def _given(self):
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return self.votes.sum(axis=1, dtype=numpy.int64) / (self.votes > 0).sum(axis=1)
+
+    # voters x events generosity, as in the results: how much more (or less) generous than
+    # the average voter of the event, in %
+    def generosity(self) -> numpy.ndarray:
+        return self._cached("generosity", self._generosity)
+
+    def _generosity(self):
+        given = self.given()
+        voted = ~numpy.isnan(given)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            average = numpy.where(voted, given, 0).sum(axis=0) / voted.sum(axis=0)
+            return (given - average) / average * 100
+
+    # artists x events average vote received, nan where the artist didn't take part
+    def received(self) -> numpy.ndarray:
+        return self._cached("received", self._received)
+
+    def _received(self):
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return self.votes.sum(axis=0, dtype=numpy.int64) / (self.votes > 0).sum(axis=0)
+
+    # change of the average received per event, least squares over the events of each artist.
+    # nan for artists with less than two events
+    def artist_trends(self) -> numpy.ndarray:
+        return self._cached("artist_trends", self._artist_trends)
+
+    def _artist_trends(self):
+        received = self.received()
+        present = ~numpy.isnan(received)
+        y = numpy.where(present, received, 0)
+        x = numpy.where(present, numpy.array(self.events, dtype=numpy.float64), 0)
+        n = present.sum(axis=1)
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            mean_x = x.sum(axis=1) / n
+            mean_y = y.sum(axis=1) / n
+            dx = numpy.where(present, x - mean_x[:, None], 0)
+            slopes = (dx * (y - mean_y[:, None])).sum(axis=1) / (dx * dx).sum(axis=1)
+        slopes[n < 2] = numpy.nan
+        return slopes
+
+    # [(voter, similarity)] of the voters who agree the most with a voter
+    def most_similar(self, voter: str, count=10) -> List:
+        row = self.voter_similarity()[self.voter_index[voter]].copy()
+        row[self.voter_index[voter]] = numpy.nan
+        # most similar first, the voters without a similarity last
+        order = numpy.argsort(numpy.where(numpy.isnan(row), numpy.inf, -row), kind="stable")
+        return [(self.voters[i], float(row[i])) for i in order[:count] if not numpy.isnan(row[i])]
+
+
+def load_history() -> VoteHistory:
+    update()
+    index = read_index()
+    return VoteHistory(index, load_votes(index))
+
+
+# events.csv tells when an event closes, index.json when another process updated the store
+_history_cache = c.FileCache(load_history, lambda: [c.events_datafile, index_file()])
+
+
+def get_history() -> VoteHistory:
+    return _history_cache.get()
+
+
+def print_series(history: VoteHistory, values: numpy.ndarray):
+    for event_id, value in zip(history.events, values.tolist()):
+        if not numpy.isnan(value):
+            print(f"{event_id:>5}  {value:.2f}")
+
+
+def main():
+    args = sys.argv[1:]
+
+    if args and args[0] == "build":
+        if update(force="force" in args[1:]):
+            index = read_index()
+            print(f"{len(index['voters'])} voters x {len(index['artists'])} artists x {len(index['events'])} events")
+        else:
+            print("already up to date")
+    elif len(args) >= 2 and args[0] == "similar":
+        history = get_history()
+        count = int(args[2]) if len(args) > 2 else 10
+        for voter, similarity in history.most_similar(args[1], count):
+            print(f"{similarity:>6.2f}  {voter}")
+    elif len(args) == 2 and args[0] == "generosity":
+        history = get_history()
+        print_series(history, history.generosity()[history.voter_index[args[1]]])
+    elif len(args) == 2 and args[0] == "trend":
+        history = get_history()
+        i = history.artist_index[args[1]]
+        print_series(history, history.received()[i])
+        print(f"trend: {history.artist_trends()[i]:+.3f} per event")
+    else:
+        print("usage: history.py build [force] | similar <user> [N] | generosity <user> | trend <artist>")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
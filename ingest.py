@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+# builds the entry manifest of an event from the folder of its submissions
+#
+# - filenames are normalized: underscores become spaces (as songs-check.sh did), unicode is NFC,
+#   runs of spaces are collapsed and the extension lowercased
+# - each file must be "<artist> - <track>.flac" or ".ogg", with the artist among the participants of
+#   the event. an artist spelled with a different case is corrected to the participants.yaml spelling
+# - size, md5 (what archive.org lists) and sha256 of every file are computed in a process pool
+# - with analyze, the audio of every file is measured too (see audio.py), and the entries that break
+#   the limits of c.audio_limits are flagged. the measurements go in the manifest, under "audio"
+#
+# the manifest is written to c.entries_manifest_path as lmcN.json. when an event has one, its entry
+# list is served from it, without asking archive.org.
+#
+# usage:
+#   ingest.py <id> <folder> [rename] [analyze] [force] [jobs=N]
+#     rename    also rename the files on disk to their normalized names
+#     analyze   also analyze the audio
+#     force     write the manifest even when some files don't validate
+
+import os
+import re
+import sys
+import json
+import hashlib
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import common as c
+import catalog
+import archive
+import registry
+
+
+chunk_size = 1024 * 1024
+
+# the fields of an entry as parse_entries() makes them from the archive file list
+archive_fields = ["artist", "track", "filename"]
+
+
+# ========================================
+# reading manifests
+
+def read_manifest(event_id: int) -> Optional[Dict]:
+    path = c.get_entries_manifest_filename(event_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+# event id -> FileCache of its manifest
+_manifests = {}
+
+
+# the entries of an event as the archive would list them, or None without a manifest
+def get_manifest_entries(event_id: int) -> Optional[List[Dict]]:
+    if event_id not in _manifests:
+        _manifests[event_id] = c.FileCache(
+            lambda: _manifest_entries(event_id), [c.get_entries_manifest_filename(event_id)]
+        )
+    return _manifests[event_id].get()
+
+
+def _manifest_entries(event_id: int) -> Optional[List[Dict]]:
+    manifest = read_manifest(event_id)
+    if manifest is None:
+        return None
+    return [{k: entry[k] for k in archive_fields} for entry in manifest["entries"]]
+
+
+def write_manifest(event_id: int, manifest: Dict):
+    path = c.get_entries_manifest_filename(event_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# ========================================
+# building manifests
+
+def normalize_filename(filename: str) -> str:
+    name, ext = os.path.splitext(unicodedata.normalize("NFC", filename))
+    name = re.sub(r"\s+", " ", name.replace("_", " ")).strip()
+    return name + ext.lower()
+
+
+# the entry of a normalized filename, or None and what is wrong with it
+def split_filename(filename: str, participants: Dict[str, str]) -> Tuple[Optional[Dict], str]:
+    name, ext = os.path.splitext(filename)
+    if ext not in archive.allowed_formats:
+        return None, f"not {' or '.join(archive.allowed_formats)}"
+    if " - " not in name:
+        return None, "not named '<artist> - <track>'"
+
+    artist, track = name.split(" - ", 1)
+    # casefolded -> participants.yaml spelling
+    if artist.casefold() not in participants:
+        return None, f"{artist} is not a participant of this event"
+    artist = participants[artist.casefold()]
+    return {"artist": artist, "track": track, "filename": f"{artist} - {track}{ext}"}, ""
+
+
+# runs in the worker processes
+def file_checksums(path) -> Dict:
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            md5.update(chunk)
+            sha256.update(chunk)
+            size += len(chunk)
+    return {"size": size, "md5": md5.hexdigest(), "sha256": sha256.hexdigest()}
+
+
+# returns (manifest, problems). with rename, the files are renamed to their normalized names
+def build_manifest(event_id: int, folder: str, rename=False, analyze=False, jobs=None) -> Tuple[Dict, List[str]]:
+    event = catalog.get_event(event_id)
+    participants = {artist.casefold(): artist for artist in registry.get().get_participants(event_id)}
+
+    problems = []
+    entries = []
+    # where each entry is on disk now
+    paths = []
+    for filename in sorted(os.listdir(folder)):
+        if not os.path.isfile(os.path.join(folder, filename)):
+            continue
+
+        entry, problem = split_filename(normalize_filename(filename), participants)
+        if entry is None:
+            problems.append(f"{filename}: {problem}")
+            continue
+
+        path = os.path.join(folder, filename)
+        if entry["filename"] != filename:
+            if not rename:
+                # it would be uploaded under a name that doesn't match the manifest
+                problems.append(f"{filename}: should be renamed to {entry['filename']} (add rename)")
+            elif os.path.exists(os.path.join(folder, entry["filename"])):
+                problems.append(f"{filename}: can't be renamed, {entry['filename']} already exists")
+                continue
+            else:
+                path = os.path.join(folder, entry["filename"])
+                os.rename(os.path.join(folder, filename), path)
+                print(f"renamed: {filename} -> {entry['filename']}")
+        entries.append(entry)
+        paths.append(path)
+
+    # the same track can be there in both formats, but only one track per artist
+    tracks = {}
+    for entry in entries:
+        tracks.setdefault(entry["artist"], set()).add(entry["track"])
+    for artist, artist_tracks in tracks.items():
+        if len(artist_tracks) > 1:
+            problems.append(f"{artist} submitted more than one track: {', '.join(sorted(artist_tracks))}")
+    for artist in participants.values():
+        if artist not in tracks:
+            problems.append(f"{artist} has no file")
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for entry, checksums in zip(entries, executor.map(file_checksums, paths)):
+            entry.update(checksums)
+
+    if analyze:
+        # numpy, which the server doesn't need otherwise
+        import audio
+        for entry, analysis in zip(entries, audio.analyze_files(paths, jobs)):
+            entry["audio"] = analysis
+
+    manifest = {
+        "event": event_id,
+        "archive": event.archive if event else "",
+        "entries": sorted(entries, key=lambda e: e["filename"]),
+    }
+    return manifest, problems
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) < 2:
+        print("usage: ingest.py <id> <folder> [rename] [analyze] [force] [jobs=N]")
+        sys.exit(1)
+
+    event_id = int(args[0])
+    folder = args[1]
+    options = args[2:]
+    jobs = None
+    for option in options:
+        if option.startswith("jobs="):
+            jobs = int(option.split("=", 1)[1])
+
+    if event_id not in registry.get().participants:
+        print(f"event {event_id} has no participants in {c.event_participants}")
+        sys.exit(1)
+
+    manifest, problems = build_manifest(
+        event_id, folder, rename="rename" in options, analyze="analyze" in options, jobs=jobs
+    )
+
+    for entry in manifest["entries"]:
+        print(f"- {entry['filename']}")
+        # flagged, but it's for the organizers to decide
+        for flag in entry.get("audio", {}).get("flags", []):
+            print(f"  ? {flag}")
+    for problem in problems:
+        print(f"! {problem}")
+
+    if problems and "force" not in options:
+        print(f"{len(problems)} problems, not writing the manifest (add force to write it anyway)")
+        sys.exit(1)
+
+    write_manifest(event_id, manifest)
+    print(f"{len(manifest['entries'])} entries written to {c.get_entries_manifest_filename(event_id)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+# append-only journal of vote changes, in front of the votes storage
+#
+# the voting form posts all of a user's votes on every radio click. instead of rewriting the
+# user's ballot each time, save_votes() only appends the votes that actually changed, one
+# json line each: {"e": event_id, "u": user, "a": artist, "v": vote, "t": timestamp}
+# posts that don't change anything don't write at all.
+#
+# reads return the stored ballots with the journal applied on top. every process tails the
+# journal file, so all workers see the same votes.
+#
+# compact() folds the journal into the storage and starts a new, empty journal.
+# it also runs automatically once the journal grows past c.vote_journal_compact_size
+#
+# usage:
+#   journal.py compact
+
+import os
+import sys
+import json
+import time
+import fcntl
+import atexit
+import threading
+from typing import List, Dict
+import common as c
+import storage
+
+
+class VoteJournal:
+    def __init__(self, path, get_storage=storage.get_storage,
+                 fsync_batch=32, fsync_interval=1.0, compact_size=None):
+        self.path = path
+        self._get_storage = get_storage
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_size = compact_size
+
+        # event_id -> user -> {artist: vote}, replayed from the journal file
+        self._overlay = {}
+        self._offset = 0
+        self._inode = None
+        # how many times another process's compaction replaced the journal under us.
+        # the records we hadn't read yet never reached the listeners, so they have to start over
+        self.resets = 0
+
+        self._fd = None
+        self._fd_inode = None
+        self._unsynced = 0
+        self._last_sync = time.time()
+        self._flusher = None
+
+        # event_id -> [callback(user, artist, vote)], see watch()
+        self._listeners = {}
+
+        self._lock = threading.RLock()
+
+    # ========================================
+    # file handling
+
+    # appends take a shared lock, compaction an exclusive one.
+    # it's a separate file because compaction replaces the journal itself
+    def _file_lock(self, mode):
+        lock_file = open(self.path + ".lock", "a")
+        fcntl.flock(lock_file, mode)
+        return lock_file
+
+    def _inode_of_path(self):
+        try:
+            return os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _open_for_append(self):
+        if self._fd is not None and self._fd_inode == self._inode_of_path():
+            return self._fd
+
+        # first write, or the journal was replaced by a compaction
+        self._close()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._fd_inode = os.fstat(self._fd).st_ino
+        return self._fd
+
+    def _close(self):
+        if self._fd is not None:
+            self.sync()
+            os.close(self._fd)
+            self._fd = None
+
+    # reads whatever was appended since the last call, by any process
+    def _catch_up(self):
+        inode = self._inode_of_path()
+        if inode != self._inode:
+            # replaced by a compaction, whose contents are now in the storage
+            if self._inode is not None:
+                self.resets += 1
+            self._overlay = {}
+            self._offset = 0
+            self._inode = inode
+        if inode is None:
+            return
+
+        with open(self.path, "rb") as file:
+            file.seek(self._offset)
+            data = file.read()
+
+        # a record still being written has no newline yet, leave it for next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            self._apply(record)
+        self._offset += end
+
+    def catch_up(self):
+        with self._lock:
+            self._catch_up()
+
+    def _apply(self, record):
+        event_votes = self._overlay.setdefault(record["e"], {})
+        event_votes.setdefault(record["u"], {})[record["a"]] = record["v"]
+
+        for listener in self._listeners.get(record["e"], []):
+            listener(record["u"], record["a"], record["v"])
+
+    # ========================================
+    # durability
+
+    def sync(self):
+        with self._lock:
+            if self._fd is not None and self._unsynced:
+                os.fsync(self._fd)
+            self._unsynced = 0
+            self._last_sync = time.time()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            if self._unsynced:
+                self.sync()
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+            atexit.register(self.sync)
+
+    # ========================================
+    # votes interface (same as storage.Storage)
+
+    def get_votes(self, event_id: int, user: str) -> Dict:
+        with self._lock:
+            self._catch_up()
+            votes = dict(self._get_storage().get_votes(event_id, user))
+            votes.update(self._overlay.get(event_id, {}).get(user, {}))
+        return votes
+
+    # unlike the storage, votes are merged into the existing ones instead of replacing them.
+    # the voting form can't unset a vote, so for the form this is the same thing.
+    # returns False if nothing changed
+    def save_votes(self, event_id: int, user: str, votes: Dict) -> bool:
+        with self._lock:
+            current = self.get_votes(event_id, user)
+
+            now = round(time.time(), 3)
+            lines = []
+            for artist, vote in votes.items():
+                if current.get(artist) != vote:
+                    record = {"e": event_id, "u": user, "a": artist, "v": vote, "t": now}
+                    lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+
+            if not lines:
+                return False
+
+            lock_file = self._file_lock(fcntl.LOCK_SH)
+            try:
+                fd = self._open_for_append()
+                # a single write, so records of concurrent workers never interleave
+                os.write(fd, "".join(lines).encode())
+            finally:
+                lock_file.close()
+
+            # apply our own records right away (and anything other workers appended before them)
+            self._catch_up()
+
+            self._unsynced += len(lines)
+            if self._unsynced >= self.fsync_batch or time.time() - self._last_sync >= self.fsync_interval:
+                self.sync()
+            self._start_flusher()
+
+            if self.compact_size and os.fstat(fd).st_size > self.compact_size:
+                self.compact()
+
+        return True
+
+    # returns the current ballots of an event, and from then on calls listener(user, artist, vote)
+    # for every vote change of that event, from any worker
+    def watch(self, event_id: int, listener) -> List[Dict]:
+        with self._lock:
+            ballots = self.get_event_votes(event_id)
+            self._listeners.setdefault(event_id, []).append(listener)
+        return ballots
+
+    def unwatch(self, event_id: int, listener):
+        with self._lock:
+            self._listeners.get(event_id, []).remove(listener)
+
+    def get_event_votes(self, event_id: int) -> List[Dict]:
+        with self._lock:
+            self._catch_up()
+            overlay = self._overlay.get(event_id, {})
+
+            ballots = []
+            for ballot in self._get_storage().get_event_votes(event_id):
+                votes = dict(ballot["votes"])
+                votes.update(overlay.get(ballot["user"], {}))
+                ballots.append({"user": ballot["user"], "votes": votes})
+
+            # users that only exist in the journal come after, in the order they first voted
+            stored_users = set(ballot["user"] for ballot in ballots)
+            for user, votes in overlay.items():
+                if user not in stored_users:
+                    ballots.append({"user": user, "votes": dict(votes)})
+
+        return ballots
+
+    # ========================================
+    # compaction
+
+    def compact(self) -> int:
+        with self._lock:
+            lock_file = self._file_lock(fcntl.LOCK_EX)
+            try:
+                return self._compact()
+            finally:
+                lock_file.close()
+
+    # freezes the shard of an event (see storage.TinyDBStorage.freeze). its votes still in the journal
+    # are folded in first, a frozen shard couldn't take them at the next compaction
+    def freeze(self, event_id: int, compress=False):
+        db = self._get_storage()
+        if not isinstance(db, storage.TinyDBStorage):
+            raise ValueError("only tinydb shards can be frozen")
+
+        with self._lock:
+            # no worker can append until the shard is frozen
+            lock_file = self._file_lock(fcntl.LOCK_EX)
+            try:
+                self._compact()
+                db.freeze(event_id, compress)
+            finally:
+                lock_file.close()
+
+    # the caller holds the exclusive file lock
+    def _compact(self) -> int:
+        self._catch_up()
+        db = self._get_storage()
+
+        count = 0
+        for event_id, users in self._overlay.items():
+            for user, votes in users.items():
+                merged = dict(db.get_votes(event_id, user))
+                merged.update(votes)
+                db.save_votes(event_id, user, merged)
+                count += 1
+
+        # the storage now has everything, start over with an empty journal.
+        # other processes notice the new inode and drop their overlay
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        open(tmp_path, "w").close()
+        os.replace(tmp_path, self.path)
+
+        self._close()
+        self._overlay = {}
+        self._offset = 0
+        self._inode = self._inode_of_path()
+        return count
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_vote_journal() -> VoteJournal:
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = VoteJournal(
+                    c.vote_journal,
+                    fsync_batch=c.vote_journal_fsync_batch,
+                    fsync_interval=c.vote_journal_fsync_interval,
+                    compact_size=c.vote_journal_compact_size,
+                )
+    return _journal
+
+
+def main():
+    args = sys.argv[1:]
+
+    if args == ["compact"]:
+        count = get_vote_journal().compact()
+        print(f"folded {count} ballots into the storage")
+    else:
+        print("usage: journal.py compact")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
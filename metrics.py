@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# counters and latency histograms of the running process, in the prometheus text format
+#
+# updating a metric is a dict update under a lock, cheap enough to stay on in production.
+# every process has its own metrics: with several gunicorn workers, a scrape only sees
+# the worker that answered it.
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Tuple
+
+
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# [(name, value)] -> {name="value",...}
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        # labelvalues -> count
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            labels = _format_labels(list(zip(self.labelnames, labelvalues)))
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=default_buckets):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labelvalues -> ([count per bucket, the last one is +Inf], sum)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *labelvalues):
+        # the first bucket whose upper bound is >= value
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labelvalues) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[i] += 1
+            self._values[labelvalues] = (counts, total + value)
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((k, (list(counts), total)) for k, (counts, total) in self._values.items())
+
+        for labelvalues, (counts, total) in values:
+            labels = list(zip(self.labelnames, labelvalues))
+            # buckets are cumulative in the exposition format
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+            labels = _format_labels(labels)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return "\n".join(lines)
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# ========================================
+# metrics
+
+request_duration = Histogram(
+    "lmc_request_duration_seconds", "Time spent handling a request.", ("route", "method", "status")
+)
+
+tinydb_file_opens = Counter("lmc_tinydb_file_opens_total", "TinyDB files opened.", ("db",))
+tinydb_reads = Counter("lmc_tinydb_reads_total", "TinyDB files read and parsed.", ("db",))
+tinydb_writes = Counter("lmc_tinydb_writes_total", "TinyDB files written.", ("db",))
+
+yaml_parses = Counter("lmc_yaml_parses_total", "YAML files parsed.", ("file",))
+csv_parses = Counter("lmc_csv_parses_total", "CSV files parsed.", ("file",))
+
+archive_get_item = Histogram(
+    "lmc_archive_get_item_seconds", "Duration of internetarchive.get_item calls.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+archive_get_item_errors = Counter("lmc_archive_get_item_errors_total", "Failed internetarchive.get_item calls.")
+
+password_hash = Histogram(
+    "lmc_password_hash_seconds", "Duration of password hash operations.", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
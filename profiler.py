@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# opt-in profiling of requests with cProfile
+#
+# enabled with LMC_PROFILE=1 (c.profile_enabled). when it's off, install() registers nothing,
+# so requests don't pay for it at all. when on, these requests are profiled:
+# - a random fraction c.profile_sample_rate of all requests (LMC_PROFILE_SAMPLE_RATE)
+# - requests of the admin user with ?profile in the url
+#
+# each profiled request is dumped to c.profile_path as <time>-<pid>-<n>-<route>.prof
+# (readable with pstats or snakeviz). the report aggregates the dumps into the top hot functions.
+#
+# usage:
+#   profiler.py report [N] [route]   top N functions (default 30) of all dumps, or of the matching routes
+
+import os
+import re
+import sys
+import time
+import random
+import itertools
+import cProfile
+import pstats
+import threading
+from flask import g, request
+import common as c
+
+
+default_top = 30
+
+# cProfile can only profile one request at a time
+_active = threading.Lock()
+# several requests can end within the same second
+_sequence = itertools.count()
+
+
+def _should_profile(is_admin) -> bool:
+    if "profile" in request.args and is_admin():
+        return True
+    return c.profile_sample_rate > 0 and random.random() < c.profile_sample_rate
+
+
+def _dump_filename() -> str:
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    route = re.sub(r"[^a-zA-Z0-9_]+", "_", route).strip("_") or "index"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_sequence)}-{route}.prof"
+
+
+# is_admin() tells whether the user of the current request is the admin
+def install(app, is_admin):
+    if not c.profile_enabled:
+        return
+
+    # registered first, so that it also covers the other before_request hooks
+    @app.before_request
+    def start_profile():
+        if not _should_profile(is_admin) or not _active.acquire(blocking=False):
+            return
+        g.profile = cProfile.Profile()
+        g.profile.enable()
+
+    @app.teardown_request
+    def stop_profile(exception):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        profile.disable()
+        _active.release()
+
+        os.makedirs(c.profile_path, exist_ok=True)
+        profile.dump_stats(os.path.join(c.profile_path, _dump_filename()))
+
+
+def list_dumps(route_filter="") -> list:
+    if not os.path.isdir(c.profile_path):
+        return []
+    return sorted(
+        os.path.join(c.profile_path, f) for f in os.listdir(c.profile_path)
+        if f.endswith(".prof") and route_filter in f
+    )
+
+
+# writes the aggregated top functions to report.txt in c.profile_path, and returns it
+def report(top=default_top, route_filter="") -> str:
+    dumps = list_dumps(route_filter)
+    if not dumps:
+        return "no profiles\n"
+
+    output_path = os.path.join(c.profile_path, "report.txt")
+    with open(output_path, "w") as file:
+        file.write(f"{len(dumps)} profiled requests\n\n")
+        stats = pstats.Stats(*dumps, stream=file)
+        stats.strip_dirs()
+        for key in ("cumulative", "tottime"):
+            file.write(f"==== top {top} by {key} ====\n")
+            stats.sort_stats(key).print_stats(top)
+
+    with open(output_path, "r") as file:
+        return file.read()
+
+
+def main():
+    args = sys.argv[1:]
+
+    if args and args[0] == "report":
+        top = int(args[1]) if len(args) > 1 else default_top
+        route_filter = args[2] if len(args) > 2 else ""
+        print(report(top, route_filter))
+    else:
+        print("usage: profiler.py report [N] [route]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+# the users (c.users_table) and the participants of every event (c.event_participants),
+# parsed once into a snapshot with lookups both ways
+#
+# the snapshot is rebuilt only when one of the two files changes. it's shared, don't modify it.
+
+from typing import Dict, FrozenSet, List
+import common as c
+
+
+class Registry:
+    def __init__(self, users: Dict[str, str], participants: Dict[int, List[str]]):
+        # username -> artist
+        self.users = users
+        # artist -> username
+        self.artists = {artist: username for username, artist in users.items()}
+        # event id -> participating artists, in file order
+        self.participants = participants
+        # event id -> participating artists, for membership tests
+        self.participant_sets: Dict[int, FrozenSet[str]] = {
+            event_id: frozenset(artists) for event_id, artists in participants.items()
+        }
+
+    def is_user(self, username: str) -> bool:
+        return username in self.users
+
+    def username_to_artist(self, username: str) -> str:
+        return self.users[username]
+
+    def artist_to_username(self, artist: str) -> str:
+        return self.artists[artist]
+
+    def get_participants(self, event_id: int) -> List[str]:
+        return self.participants[int(event_id)]
+
+    def is_participant(self, event_id: int, artist: str) -> bool:
+        return artist in self.participant_sets.get(int(event_id), ())
+
+
+def load() -> Registry:
+    return Registry(c.get_users_table(), c.load_yaml(c.event_participants))
+
+
+_registry_cache = c.FileCache(load, [c.users_table, c.event_participants])
+
+
+def get() -> Registry:
+    return _registry_cache.get()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# caching of rendered pages that only depend on files on disk
+#
+# the rendered bytes (and a gzipped copy) are kept until the mtime of any of the page's source
+# files changes. responses carry a strong ETag and Last-Modified, and conditional requests
+# that match get a 304 without rendering anything.
+
+from flask import request, make_response
+from functools import wraps
+from email.utils import formatdate
+import hashlib
+import gzip
+import threading
+import common as c
+
+
+# so that an unbounded number of urls (e.g. invalid event ids) can't grow the cache forever
+max_entries = 256
+
+
+class CachedPage:
+    __slots__ = ("stamp", "body", "gzip_body", "etag", "last_modified", "status", "headers")
+
+
+_pages = {}
+_lock = threading.Lock()
+
+# page key -> list of source paths, for tools that need to know what a page depends on
+registered_sources = {}
+
+
+def _render(view, kwargs, stamp):
+    response = make_response(view(**kwargs))
+
+    page = CachedPage()
+    page.stamp = stamp
+    page.body = response.get_data()
+    page.gzip_body = gzip.compress(page.body, compresslevel=9, mtime=0)
+    page.etag = hashlib.sha1(page.body).hexdigest()
+    mtimes = [mtime for _, mtime in stamp if mtime is not None]
+    page.last_modified = max(mtimes) // 1_000_000_000 if mtimes else None
+    page.status = response.status_code
+    page.headers = [(k, v) for k, v in response.headers.items() if k not in ("Content-Length",)]
+    return page
+
+
+def _not_modified(page, etag) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and page.last_modified is not None:
+        return request.if_modified_since.timestamp() >= page.last_modified
+    return False
+
+
+def _respond(page):
+    use_gzip = "gzip" in request.accept_encodings and len(page.gzip_body) < len(page.body)
+    # a different representation needs a different strong etag
+    etag = page.etag + "-gz" if use_gzip else page.etag
+
+    if _not_modified(page, etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(page.gzip_body if use_gzip else page.body, page.status)
+        for k, v in page.headers:
+            response.headers[k] = v
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+
+    response.set_etag(etag)
+    if page.last_modified is not None:
+        response.headers["Last-Modified"] = formatdate(page.last_modified, usegmt=True)
+    response.headers["Vary"] = "Accept-Encoding"
+    # can be stored, but must be revalidated every time
+    response.headers["Cache-Control"] = "public, no-cache"
+    return response
+
+
+# sources(**view_kwargs) returns the paths the page is rendered from
+# bypass() returning True renders the page normally, e.g. for personalised variants
+def cached_response(sources, bypass=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if bypass is not None and bypass():
+                return view(**kwargs)
+
+            paths = sources(**kwargs)
+            key = (view.__name__, tuple(sorted(kwargs.items())))
+            registered_sources[key] = paths
+            stamp = tuple((path, c.file_mtime(path)) for path in paths)
+
+            page = _pages.get(key)
+            if page is None or page.stamp != stamp:
+                page = _render(view, kwargs, stamp)
+                with _lock:
+                    if len(_pages) >= max_entries:
+                        _pages.clear()
+                    _pages[key] = page
+
+            return _respond(page)
+        return wrapper
+    return decorator
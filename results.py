@@ -1,30 +1,46 @@
 #!/usr/bin/env python3
 
-from collections import defaultdict
 import sys
 import statistics
-import pandas as pd
 import numpy
 import common as c
-import copy
+import journal
+import voting
+import results_export
+import registry
+import analytics as lmc_analytics
 import os
+import io
+import time
 import json
+import hashlib
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict
 
 
-users_table_cached = {}
+vote_values = [5, 4, 3, 2, 1]
 
-check_only = False
+# sheets of the results spreadsheet
+sheet_names = ["scoreboard", "votes", "generosity", "distribution", "notes"]
+# added with analytics
+analytics_sheet_name = "rankings"
 
 
-def username_to_artist(username):
-    return users_table_cached[username]
+# what to do when participants haven't finished voting:
+#   ask         prompt (the default when running a single event)
+#   disqualify  disqualify them and generate anyway
+#   skip        don't generate this event
+missing_policies = ["ask", "disqualify", "skip"]
+# what to do when the spreadsheet files already exist: ask, yes (overwrite) or no (skip the event)
+overwrite_policies = ["ask", "yes", "no"]
 
+first_event = 18
 
-def artist_to_username(artist):
-    # swap key/value
-    # reverse_dict = {v:k for k,v in users_table_cached.items()}
-    reverse_dict = dict((v,k) for k,v in users_table_cached.items())
-    return reverse_dict[artist]
+
+# raised by generate_results when a policy says not to go on with the event
+class ResultsSkipped(Exception):
+    pass
 
 
 def main():
@@ -34,167 +50,218 @@ def main():
         sys.exit(1)
 
     args = sys.argv[1:]
+
+    if args[0] == "batch":
+        batch_main(args[1:])
+        return
+
     arg_event = int(args[0])
 
-    global check_only
-    if len(args) > 1:
-        if args[1] == "check":
-            check_only = True
+    check_only = len(args) > 1 and args[1] == "check"
+    # compare the scoreboard with the existing json file instead of writing anything
+    verify_only = len(args) > 1 and args[1] == "verify"
+    # also write the alternative rankings
+    analytics = True if "analytics" in args[1:] else None
 
-    current_event = c.get_current_voting_event()
-    if arg_event > current_event or arg_event < 18:
+    current_event = voting.get_current_voting_event()
+    if arg_event > current_event or arg_event < first_event:
         print("We don't have the data for this event.")
         sys.exit(1)
 
-    global users_table_cached
-    users_table_cached = c.get_users_table()
-
-    generate_results(arg_event)
-
-
-
-def rename_dict_key(dictionary, old_key, new_key):
-    if old_key == new_key:
+    try:
+        scoreboard = generate_results(
+            arg_event, overwrite=None if verify_only else "ask", check_only=check_only, analytics=analytics
+        )
+    except ResultsSkipped:
         return
 
-    if old_key in dictionary:
-        dictionary[new_key] = dictionary[old_key]
-        del dictionary[old_key]
-
+    if verify_only and not verify_scoreboard(arg_event, scoreboard):
+        sys.exit(1)
 
-def generate_results(event_id):
-    db = c.get_votes_db(event_id)
 
-    # participating_usernames = c.get_event_participants(event_id)
+# the votes of an event as a dense voters x recipients matrix
+#
+# voters are in ballot order, recipients (usernames) sorted by name, which is also the order
+# the votes of a ballot are sorted in.
+# present marks the cells that are part of a ballot: the votes cast, plus the own cell of a
+# participant, which is always there (a missing self vote counts as 0).
+# votes holds the values, with self votes zeroed.
+class VoteMatrix:
+    def __init__(self, ballots, participating_usernames, artists_to_usernames: Dict[str, str]):
+        participants = set(participating_usernames)
+
+        self.voters = [ballot["user"] for ballot in ballots]
+
+        # ballots with the artist names converted to usernames
+        ballots_votes = [
+            {artists_to_usernames[artist]: int(vote) for artist, vote in ballot["votes"].items()}
+            for ballot in ballots
+        ]
+
+        recipients = set()
+        for voter, votes in zip(self.voters, ballots_votes):
+            recipients.update(votes)
+            if voter in participants:
+                recipients.add(voter)
+        self.recipients = sorted(recipients)
+        recipient_index = {user: i for i, user in enumerate(self.recipients)}
+
+        rows, cols, values = [], [], []
+        for row, votes in enumerate(ballots_votes):
+            for to_user, vote in votes.items():
+                rows.append(row)
+                cols.append(recipient_index[to_user])
+                values.append(vote)
+
+        shape = (len(self.voters), len(self.recipients))
+        self.votes = numpy.zeros(shape, dtype=numpy.int64)
+        self.present = numpy.zeros(shape, dtype=bool)
+        rows = numpy.array(rows, dtype=numpy.intp)
+        cols = numpy.array(cols, dtype=numpy.intp)
+        self.votes[rows, cols] = values
+        self.present[rows, cols] = True
+
+        # own cells
+        self.voter_is_participant = numpy.array([v in participants for v in self.voters], dtype=bool)
+        self_rows = numpy.array([row for row, v in enumerate(self.voters) if v in recipient_index], dtype=numpy.intp)
+        self_cols = numpy.array([recipient_index[self.voters[row]] for row in self_rows], dtype=numpy.intp)
+        self_voted = self.present[self_rows, self_cols]
+
+        # self votes as they were cast, nan for participants that didn't cast one
+        self.self_votes = {}
+        for row, col, voted in zip(self_rows.tolist(), self_cols.tolist(), self_voted.tolist()):
+            if self.voter_is_participant[row]:
+                self.self_votes[self.voters[row]] = int(self.votes[row, col]) if voted else numpy.nan
+
+        self.votes[self_rows, self_cols] = 0
+        participant_self = self.voter_is_participant[self_rows]
+        self.present[self_rows, self_cols] |= participant_self
+
+        # number of votes in each ballot, own cell included
+        self.ballot_lengths = self.present.sum(axis=1)
+
+    # votes of a ballot as the list of its cells in recipient order
+    def ballot(self, row) -> List[int]:
+        return self.votes[row, self.present[row]].tolist()
+
+    # recipients in the order they first appear when going through the ballots
+    def recipients_by_appearance(self) -> numpy.ndarray:
+        first_row = numpy.argmax(self.present, axis=0)
+        cols = numpy.arange(len(self.recipients))
+        return numpy.lexsort((cols, first_row))
+
+
+# statistics.mean semantics: an int if the mean of the int votes is exact, a float otherwise
+def mean_of_votes(total: int, count: int):
+    if count == 0:
+        raise statistics.StatisticsError("mean requires at least one data point")
+    if total % count == 0:
+        return total // count
+    return total / count
+
+
+# returns the scoreboard, or None with check_only.
+# raises ResultsSkipped if the missing/overwrite policy stops it.
+# with overwrite=None nothing is written at all.
+# formats are the results_export formats of the spreadsheet, c.results_formats by default.
+# analytics adds the rankings of analytics.py, c.results_analytics by default
+def generate_results(event_id, missing="ask", overwrite="ask", check_only=False, formats=None, analytics=None):
+    # stored votes plus the ones still in the journal
+    db = journal.get_vote_journal()
+    # one snapshot for the whole event
+    users = registry.get()
 
     # convert participating artists to usernames
-    participating_artists = c.get_event_participants(event_id)
+    participating_artists = users.get_participants(event_id)
     participating_usernames = []
     for artist in participating_artists:
-        participating_usernames.append(artist_to_username(artist))
-
-
-    self_votes = {}
-
-    votes_received = defaultdict(list)
-    votes_given = defaultdict(list)
-
-    # rename all artist names to usernames
-    user_entries_orig = db.all()
-    user_entries = copy.deepcopy(user_entries_orig)
-    for i in range(len(user_entries_orig)):
-        entry = user_entries_orig[i]
-        for to_artist in entry["votes"]:
-            to_user = artist_to_username(to_artist)
-            rename_dict_key(user_entries[i]["votes"], to_artist, to_user)
-
-
-    # generate votes_given and votes_received
-    # self votes get zeroed for further calculations
-    for user_entry in user_entries:
-        from_user = user_entry["user"]
-
-        if from_user in participating_usernames:
-            if from_user in user_entry["votes"]:
-                # if we have a self vote, store it as is
-                self_votes[from_user] = int(user_entry["votes"][from_user])
-            else:
-                # if there isn't, make it zero
-                user_entry["votes"][from_user] = '0'
-                self_votes[from_user] = numpy.nan
-
-        # sort votes by to_artist
-        votes_from_user = dict(sorted(user_entry["votes"].items()))
-
-        for to_user,vote in votes_from_user.items():
-            if to_user == from_user:
-                votes_given[from_user].append(0)
-                votes_received[to_user].append(0)
-            else:
-                votes_given[from_user].append(int(vote))
-                votes_received[to_user].append(int(vote))
-
+        participating_usernames.append(users.artist_to_username(artist))
 
+    matrix = VoteMatrix(db.get_event_votes(event_id), participating_usernames, users.artists)
+    voter_row = {voter: row for row, voter in enumerate(matrix.voters)}
 
     missing_votes_by_users = []
     for user in participating_usernames:
-        if not user in votes_given or len(votes_given[user]) < len(participating_usernames) - 1:
+        if not user in voter_row or matrix.ballot_lengths[voter_row[user]] < len(participating_usernames) - 1:
             print(f"user {user} has not completed the voting")
             missing_votes_by_users.append(user)
 
-    for user,votes in votes_given.items():
-        if not user in participating_usernames and len(votes) < len(participating_artists):
+    # empty ballots don't count as having voted at all
+    givers = [user for row, user in enumerate(matrix.voters) if matrix.ballot_lengths[row] > 0]
+
+    for user in givers:
+        row = voter_row[user]
+        if not matrix.voter_is_participant[row] and matrix.ballot_lengths[row] < len(participating_artists):
             print(f"non-participant {user} has started but not completed the voting")
 
     if missing_votes_by_users:
         print(f"=== votes are still missing by users: {missing_votes_by_users} ===")
-        answer = input("continue anyway? (missing users will be disqualified) (y/N)")
-        if answer != "y":
-            exit()
+        if missing == "skip":
+            raise ResultsSkipped(f"votes missing by {', '.join(missing_votes_by_users)}")
+        if missing == "ask":
+            answer = input("continue anyway? (missing users will be disqualified) (y/N)")
+            if answer != "y":
+                raise ResultsSkipped("votes missing")
         print("=== continuing ===")
     else:
         print("=== all votes are present! continuing ===")
 
     if check_only:
-        exit()
+        return None
     else:
         print("=== generating results... ===")
 
     disqualified_users = missing_votes_by_users
 
-    for missing_user in disqualified_users:
-        votes_given[missing_user] = [-1] * len(participating_usernames)
-        self_votes[missing_user] = -1
-
+    # ballots of disqualified users don't count for their own statistics,
+    # but the votes they gave still count for the others
+    counted_rows = numpy.array([v not in disqualified_users for v in matrix.voters], dtype=bool).reshape(-1)
 
-    def my_sort(tuple):
-        user = tuple[0]
+    def my_sort(user):
         # sort participating users first, non-participating last
         # then by name
         return (not user in participating_usernames, user)
 
-
     # sort by from_user
-    votes_given = dict(sorted(votes_given.items(), key=my_sort))
-    self_votes = dict(sorted(self_votes.items()))
+    givers = sorted(set(givers) | set(disqualified_users), key=my_sort)
+
+    votes_given = {}
+    for user in givers:
+        if user in disqualified_users:
+            votes_given[user] = [-1] * len(participating_usernames)
+        else:
+            votes_given[user] = matrix.ballot(voter_row[user])
 
-    votes_matrix_given = list(votes_given.values())
-    # votes_matrix_received = numpy.transpose(votes_matrix_given)
+    self_votes = dict(matrix.self_votes)
+    for missing_user in disqualified_users:
+        self_votes[missing_user] = -1
+    self_votes = dict(sorted(self_votes.items()))
 
     # ========================================
     # calculate votes distribution
 
-    votes_distribution = {}
-    for i in range(5, 0, -1):
-        votes_distribution[i] = {'count': 0, '%': 0}
+    counted_votes = matrix.votes[counted_rows]
+    # (value, count) of the votes given, 5s first
+    distribution_counts = (counted_votes[:, :, None] == vote_values).sum(axis=(0, 1))
+    total_votes = int(distribution_counts.sum())
 
-    for votes in votes_matrix_given:
-        for vote in votes:
-            if vote <= 0:
-                continue
-            votes_distribution[vote]['count'] += 1
-
-    total_votes = 0
-    for vote,values in votes_distribution.items():
-        total_votes += values['count']
-
-    for vote,values in votes_distribution.items():
-        values['%'] = round(values['count'] / total_votes * 100, 1)
+    votes_distribution = {}
+    for vote, count in zip(vote_values, distribution_counts.tolist()):
+        votes_distribution[vote] = {'count': count, '%': round(count / total_votes * 100, 1)}
 
     # ========================================
     # calculate generosity
 
-    generosity_stats = {}
+    row_sums = matrix.votes.sum(axis=1)
+    # one of the votes of a participant is own-vote so 0, so we skip that
+    row_lengths = matrix.ballot_lengths - matrix.voter_is_participant
 
-    for user,votes in votes_given.items():
+    generosity_stats = {}
+    for user in givers:
         if user in disqualified_users:
             continue
-        generosity_stats[user] = {}
-        len_votes = len(votes)
-        if user in participating_usernames:
-            # one of the votes is own-vote so 0, so we skip that
-            len_votes -= 1
-        generosity_stats[user]['given'] = round(sum(votes) / len_votes, 1)
+        row = voter_row[user]
+        generosity_stats[user] = {'given': round(int(row_sums[row]) / int(row_lengths[row]), 1)}
 
     generosity_sum = 0
     for k,v in generosity_stats.items():
@@ -208,31 +275,32 @@ def generate_results(event_id):
     # ========================================
     # gather participant votes and calculate averages
 
-    participant_stats = {}
+    scores = matrix.votes.sum(axis=0)
+    # recipients x (5s, 4s, 3s, 2s, 1s)
+    counts = (matrix.votes[:, :, None] == vote_values).sum(axis=0)
+    positive_counts = (matrix.votes > 0).sum(axis=0)
+
+    order = matrix.recipients_by_appearance()
 
-    for user,votes in votes_received.items():
-        votes_sum = sum(votes)
-        avg = statistics.mean(filter(lambda x: x > 0, votes))
-        avg = round(avg, 1)
+    participant_stats = {}
+    for col in order.tolist():
+        user = matrix.recipients[col]
         participant_stats[user] = {
-            'score': votes_sum,
-            'average': avg,
+            'score': int(scores[col]),
+            'average': round(mean_of_votes(int(scores[col]), int(positive_counts[col])), 1),
         }
-        for v in range(5, 0, -1):
-            participant_stats[user][str(v) + "s"] = len(list(filter(lambda n: n == v, votes)))
-
-    def score_sort(item):
-        if item[0] in disqualified_users:
-            # if disqualified return large value to ensure it's ordered last
-            return (-1,)
+        for v, count in zip(vote_values, counts[col].tolist()):
+            participant_stats[user][str(v) + "s"] = count
 
-        return (item[1]["score"],
-                item[1]["5s"],
-                item[1]["4s"],
-                item[1]["3s"],
-                item[1]["2s"])
+    # ranking: score, then 5s, 4s, 3s, 2s, all descending. disqualified last.
+    # ties keep the order of participant_stats (lexsort is stable)
+    disqualified = numpy.array([matrix.recipients[col] in disqualified_users for col in order], dtype=bool)
+    ranking_keys = numpy.column_stack([scores[order], counts[order][:, :4]])
+    ranking_keys[disqualified] = 0
+    ranking = numpy.lexsort([numpy.arange(len(order))] + [-k for k in ranking_keys.T[::-1]] + [disqualified])
 
-    participant_stats_ordered = dict(sorted(participant_stats.items(), key=score_sort, reverse=True))
+    users_in_order = list(participant_stats.keys())
+    participant_stats_ordered = {users_in_order[i]: participant_stats[users_in_order[i]] for i in ranking.tolist()}
 
     # ========================================
     # generate scoreboard
@@ -242,7 +310,7 @@ def generate_results(event_id):
     counter = 1
     for user,stats in participant_stats_ordered.items():
         entry = {}
-        entry["name"] = username_to_artist(user)
+        entry["name"] = users.username_to_artist(user)
         if user in disqualified_users:
             entry["placement"] = "DQ"
         else:
@@ -259,64 +327,90 @@ def generate_results(event_id):
         # we have to delete it before writing the dict to ods
         del entry["placement"]
 
+    if overwrite is None:
+        return scoreboard
+
+    if analytics is None:
+        analytics = c.results_analytics
+
+    # ========================================
+    # alternative rankings
+
+    rankings = None
+    if analytics:
+        ranked_users = [user for user in participant_stats_ordered if user not in disqualified_users]
+        recipient_col = {user: col for col, user in enumerate(matrix.recipients)}
+        rankings = lmc_analytics.compute_rankings(
+            matrix.votes[:, [recipient_col[user] for user in ranked_users]],
+            [users.username_to_artist(user) for user in ranked_users],
+            list(range(1, len(ranked_users) + 1)),
+            seed=event_id,
+        )
+
     # ========================================
-    # generate ods file
-
-    scoreboard_df = pd.DataFrame.from_dict(scoreboard, orient='index')
-    generosity_df = pd.DataFrame.from_dict(generosity_stats, orient='index')
-    votes_distribution_df = pd.DataFrame.from_dict(votes_distribution, orient='index')
-
-    votes_given_chart_df = pd.DataFrame.from_dict(votes_given, orient='index')
-    votes_given_chart_df.columns = sorted(participating_usernames)
-    votes_given_chart_df = votes_given_chart_df.replace(0, numpy.nan)
-    votes_given_chart_df = votes_given_chart_df.replace(-1, numpy.nan)
-
-    votes_given_chart_df.loc['total score',:] = votes_given_chart_df.sum(axis=0, skipna=True)
-    # the iloc slice [:-1] selects all rows except last
-    votes_given_chart_df.loc[:,'total given'] = votes_given_chart_df.iloc[:-1].sum(axis=1)
-    # to only show total given for participating users:
-    # votes_given_chart_df.loc[:,'total given'] = votes_given_chart_df.iloc[:len(participating_usernames)].sum(axis=1)
-
-    votes_given_chart_df.loc[''] = pd.Series([None] * len(votes_given_chart_df.columns))
-
-    # average of participant columns (all minus the last one)
-    # for participant rows (all minus last two we just added)
-    # this would calculate the average again. but we already have that, so just use that
-    # votes_given_chart_df.loc['average',:] = votes_given_chart_df.iloc[:-2, :-1].mean(axis=0, skipna=True)
-    avgs_list = []
-    for k,v in participant_stats.items():
-        avgs_list.append(v['average'])
-    votes_given_chart_df.loc['average',:] = avgs_list + [numpy.nan]
-
-    # when setting the row, we need to add an extra value to match the total row length
-    votes_given_chart_df.loc['self vote',:] = list(self_votes.values()) + [numpy.nan]
-
-    notes = {'notes': [
+    # generate the spreadsheet
+
+    notes = [
         "this spreadsheet was automatically generated with this script:",
         "https://github.com/nyxkn/libre-music-challenge/blob/main/results.py",
         "",
         "generosity",
         "a generosity of 0 is the average generosity",
         "positive/negative values show how much more/less generous than the average the voting was"
-    ]}
-    notes_df = pd.DataFrame(notes)
-
-
-    filename = f"{c.results_path}/lmc{event_id}-results.ods"
-
-    if os.path.exists(filename):
-        answer = input(f"{filename} already exists! overwrite? (y/N)")
-        if answer != "y":
-            exit()
-
-    # excelwriter has an issue with python linters. ignore this error
-    # the pylint comment doesn't seem to work. are we even using pylint?
-    with pd.ExcelWriter(f"{c.results_path}/lmc{event_id}-results.ods", mode="w", engine="odf") as writer: #pylint: disable=abstract-class-instantiated
-        scoreboard_df.to_excel(writer, sheet_name="scoreboard")
-        votes_given_chart_df.to_excel(writer, sheet_name="votes")
-        generosity_df.to_excel(writer, sheet_name="generosity")
-        votes_distribution_df.to_excel(writer, sheet_name="distribution")
-        notes_df.to_excel(writer, sheet_name="notes", header=False, index=False)
+    ]
+
+    # a table of dicts, with the keys as the first column and an empty top left cell
+    def table_rows(table):
+        columns = []
+        for stats in table.values():
+            columns += [k for k in stats if k not in columns]
+        yield [None] + columns
+        for key, stats in table.items():
+            yield [key] + [stats.get(column) for column in columns]
+
+    def votes_rows():
+        columns = sorted(participating_usernames)
+        yield [None] + columns + ["total given"]
+
+        # 0 is the own vote and -1 a disqualified user, both left empty
+        totals = [0] * len(columns)
+        for user, votes in votes_given.items():
+            cells = [vote if vote > 0 else None for vote in votes]
+            # an incomplete ballot of a non-participant is shorter, and is filled up at the end
+            cells += [None] * (len(columns) - len(cells))
+            for i, vote in enumerate(cells):
+                if vote is not None:
+                    totals[i] += vote
+            yield [user] + cells + [sum(vote for vote in cells if vote is not None)]
+
+        yield ["total score"] + totals + [None]
+        yield [""] + [None] * (len(columns) + 1)
+        # already calculated for the scoreboard
+        yield ["average"] + [stats['average'] for stats in participant_stats.values()] + [None]
+        yield ["self vote"] + list(self_votes.values()) + [None]
+
+    def build_sheets():
+        return [
+            results_export.Sheet("scoreboard", table_rows(scoreboard)),
+            results_export.Sheet("votes", votes_rows()),
+            results_export.Sheet("generosity", table_rows(generosity_stats)),
+            results_export.Sheet("distribution", table_rows(votes_distribution)),
+            results_export.Sheet("notes", ([line] for line in notes)),
+        ] + ([results_export.Sheet(analytics_sheet_name, lmc_analytics.sheet_rows(rankings))] if rankings else [])
+
+    output_formats = formats or c.results_formats
+    existing = [f for f in results_export.output_files(event_id, output_sheet_names(analytics), output_formats)
+                if os.path.exists(f)]
+
+    if existing:
+        if overwrite == "no":
+            raise ResultsSkipped(f"{existing[0]} already exists")
+        if overwrite == "ask":
+            answer = input(f"{', '.join(existing)} already exists! overwrite? (y/N)")
+            if answer != "y":
+                raise ResultsSkipped(f"{existing[0]} already exists")
+
+    results_export.write_results(event_id, build_sheets, output_formats)
 
 
     # ========================================
@@ -328,6 +422,234 @@ def generate_results(event_id):
     with open(json_filename, 'w') as json_file:
         json.dump(scoreboard, json_file, indent=4)
 
+    if rankings:
+        with open(c.get_rankings_filename(event_id), 'w') as json_file:
+            json.dump(rankings, json_file, indent=4)
+
+    return scoreboard
+
+
+def output_sheet_names(analytics) -> List[str]:
+    return sheet_names + [analytics_sheet_name] if analytics else sheet_names
+
+
+# the published scoreboards are the reference: regenerating them must give the same bytes
+def verify_scoreboard(event_id, scoreboard):
+    json_filename = f"{c.results_path}/lmc{event_id}-scoreboard.json"
+    with open(json_filename, 'r') as json_file:
+        published = json_file.read()
+
+    if json.dumps(scoreboard, indent=4) == published:
+        print(f"=== {json_filename} is identical ===")
+        return True
+    else:
+        print(f"=== {json_filename} differs! ===")
+        return False
+
+
+# ========================================
+# batch regeneration
+#
+# results.py batch [first-last | id] [missing=disqualify|skip] [overwrite=yes|no] [formats=ods,csv,jsonl]
+#                  [jobs=N] [force] [analytics]
+#
+# regenerates a range of events (all of them by default) in parallel, without prompting.
+# events whose inputs (votes, participants, usernames and this script) are the same as the
+# last time they were generated are skipped, unless forced.
+
+# hash of everything the results of an event are computed from
+def input_hash(event_id: int, analytics=False) -> str:
+    sha = hashlib.sha256()
+    # a scoring fix changes the results too
+    sources = [__file__] + ([lmc_analytics.__file__] if analytics else [])
+    for path in sources:
+        with open(path, "rb") as source:
+            sha.update(source.read())
+
+    inputs = {
+        "votes": journal.get_vote_journal().get_event_votes(event_id),
+        "participants": registry.get().get_participants(event_id),
+        "users": registry.get().users,
+    }
+    # ballots keep their order, which decides the order of the tables
+    sha.update(json.dumps(inputs, sort_keys=True).encode())
+    return sha.hexdigest()
+
+
+def load_input_hashes() -> Dict[str, str]:
+    if not os.path.exists(c.results_hashes_file):
+        return {}
+    with open(c.results_hashes_file, "r") as file:
+        return json.load(file)
+
+
+def save_input_hashes(hashes: Dict[str, str]):
+    os.makedirs(os.path.dirname(c.results_hashes_file) or ".", exist_ok=True)
+    tmp_path = c.results_hashes_file + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(hashes, file, indent=4, sort_keys=True)
+    os.replace(tmp_path, c.results_hashes_file)
+
+
+def read_file(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        return file.read()
+
+
+# runs in the worker processes. returns a row of the summary
+def batch_event(event_id: int, missing: str, overwrite: str, formats: List[str], analytics: bool, known_hash) -> Dict:
+    started = time.time()
+    result = {"event": event_id, "status": "", "scoreboard": "", "winner": "", "hash": None, "output": ""}
+
+    json_filename = c.get_scoreboard_filename(event_id)
+    outputs = [json_filename] + results_export.output_files(event_id, output_sheet_names(analytics), formats)
+    if analytics:
+        outputs.append(c.get_rankings_filename(event_id))
+
+    if event_id not in registry.get().participants:
+        result["status"] = f"skipped: no participants in {c.event_participants}"
+        result["seconds"] = time.time() - started
+        return result
+
+    try:
+        result["hash"] = input_hash(event_id, analytics)
+    except Exception as e:
+        result["status"] = f"error: {type(e).__name__}: {e}"
+        result["seconds"] = time.time() - started
+        return result
+
+    if result["hash"] == known_hash and all(os.path.exists(f) for f in outputs):
+        result["status"] = "unchanged"
+        result["seconds"] = time.time() - started
+        return result
+
+    previous = read_file(json_filename)
+
+    # the prints of the workers would interleave
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            scoreboard = generate_results(
+                event_id, missing=missing, overwrite=overwrite, formats=formats, analytics=analytics
+            )
+    except ResultsSkipped as e:
+        result["status"] = f"skipped: {e}"
+        result["hash"] = None
+    except Exception as e:
+        result["status"] = f"error: {type(e).__name__}: {e}"
+        result["hash"] = None
+    else:
+        result["status"] = "generated"
+        if previous is None:
+            result["scoreboard"] = "new"
+        else:
+            result["scoreboard"] = "same" if read_file(json_filename) == previous else "changed"
+        result["winner"] = scoreboard[1]["name"] if 1 in scoreboard else ""
+
+    result["output"] = output.getvalue()
+    result["seconds"] = time.time() - started
+    return result
+
+
+def batch_generate(event_ids: List[int], missing="skip", overwrite="yes", formats=None,
+                   jobs=None, force=False, analytics=None) -> List[Dict]:
+    formats = formats or c.results_formats
+    analytics = c.results_analytics if analytics is None else analytics
+    hashes = {} if force else load_input_hashes()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(batch_event, event_id, missing, overwrite, formats, analytics, hashes.get(str(event_id)))
+            for event_id in event_ids
+        ]
+        results = [future.result() for future in futures]
+
+    hashes = load_input_hashes()
+    for result in results:
+        if result["hash"] is not None:
+            hashes[str(result["event"])] = result["hash"]
+        else:
+            # retry next time
+            hashes.pop(str(result["event"]), None)
+    save_input_hashes(hashes)
+
+    return results
+
+
+def print_summary(results: List[Dict]):
+    print(f"{'event':>5}  {'status':<12}  {'scoreboard':<10}  {'time':>6}  winner")
+    for result in results:
+        status = result["status"]
+        # skip and error reasons go on their own line
+        reason = ""
+        if ": " in status:
+            status, reason = status.split(": ", 1)
+        print(f"{result['event']:>5}  {status:<12}  {result['scoreboard']:<10}  {result['seconds']:>5.1f}s  {result['winner']}")
+        if reason:
+            print(f"{'':>5}  {reason}")
+
+    changed = [r["event"] for r in results if r["scoreboard"] in ("new", "changed")]
+    print(f"scoreboards changed: {', '.join(map(str, changed)) if changed else 'none'}")
+
+
+def batch_main(args):
+    current_event = voting.get_current_voting_event()
+    first, last = first_event, current_event
+    explicit_range = False
+    options = {"missing": "skip", "overwrite": "yes", "formats": None, "jobs": None}
+    force = False
+    analytics = None
+
+    for arg in args:
+        if arg == "force":
+            force = True
+        elif arg == "analytics":
+            analytics = True
+        elif "=" in arg:
+            key, value = arg.split("=", 1)
+            if key not in options:
+                print(f"unknown option {key}")
+                sys.exit(1)
+            options[key] = value
+        elif "-" in arg:
+            first, last = (int(n) for n in arg.split("-", 1))
+            explicit_range = True
+        else:
+            first = last = int(arg)
+            explicit_range = True
+
+    # no prompts in the workers
+    if options["missing"] not in missing_policies[1:] or options["overwrite"] not in overwrite_policies[1:]:
+        print(f"missing must be one of {missing_policies[1:]}, overwrite one of {overwrite_policies[1:]}")
+        sys.exit(1)
+    jobs = int(options["jobs"]) if options["jobs"] else None
+    formats = options["formats"].split(",") if options["formats"] else None
+    if formats and not set(formats) <= set(results_export.formats):
+        print(f"formats must be among {results_export.formats}")
+        sys.exit(1)
+
+    first, last = max(first, first_event), min(last, current_event)
+    if first > last:
+        print("We don't have the data for these events.")
+        sys.exit(1)
+
+    event_ids = list(range(first, last + 1))
+    if not explicit_range:
+        # the running event has no participants until its submissions are in
+        participants = registry.get().participants
+        event_ids = [event_id for event_id in event_ids if event_id in participants]
+        if not event_ids:
+            print("We don't have the data for these events.")
+            sys.exit(1)
+
+    results = batch_generate(event_ids, options["missing"], options["overwrite"], formats, jobs, force, analytics)
+    print_summary(results)
+
+    if any(r["status"].startswith("error") for r in results):
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# writers for the sheets of the results spreadsheet
+#
+# a sheet is a name and an iterable of rows, each a list of cells: str, int, float, or None for
+# an empty cell. rows are consumed one at a time, so they can come from a generator.
+#
+#   ods    lmcN-results.ods. content.xml is streamed into the zip row by row, inside the package
+#          skeleton of odswriter. falls back to pandas if odswriter is not installed
+#   csv    lmcN-results-<sheet>.csv, one file per sheet
+#   jsonl  lmcN-results.jsonl, one {"sheet": name, "row": [cells]} line per row
+
+import csv
+import json
+import math
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+from typing import Iterable, List, NamedTuple
+import common as c
+
+try:
+    from odswriter import ods_components
+except ImportError:
+    ods_components = None
+
+
+formats = ["ods", "csv", "jsonl"]
+
+
+class Sheet(NamedTuple):
+    name: str
+    rows: Iterable[List]
+
+
+# numpy scalars and nan don't mean anything to the writers
+def clean_cell(cell):
+    if cell is None or isinstance(cell, str):
+        return cell
+    if hasattr(cell, "item"):
+        cell = cell.item()
+    if isinstance(cell, float) and math.isnan(cell):
+        return None
+    return cell
+
+
+def clean_rows(rows):
+    for row in rows:
+        yield [clean_cell(cell) for cell in row]
+
+
+def output_files(event_id: int, sheet_names: List[str], output_formats: List[str]) -> List[str]:
+    base = f"{c.results_path}/lmc{event_id}-results"
+    files = []
+    for output_format in output_formats:
+        if output_format == "csv":
+            files += [f"{base}-{name}.csv" for name in sheet_names]
+        else:
+            files.append(f"{base}.{output_format}")
+    return files
+
+
+# ========================================
+# backends
+
+def ods_cell(cell) -> str:
+    if cell is None:
+        return "<table:table-cell/>"
+    if isinstance(cell, (int, float)):
+        return f'<table:table-cell office:value-type="float" office:value="{cell}"><text:p>{cell}</text:p></table:table-cell>'
+    return f'<table:table-cell office:value-type="string"><text:p>{escape(str(cell))}</text:p></table:table-cell>'
+
+
+def write_ods(path, sheets: List[Sheet]):
+    if ods_components is None:
+        write_ods_pandas(path, sheets)
+        return
+
+    # the empty spreadsheet of the skeleton, split where the tables go
+    head, tail = ods_components.content_xml.split("<office:spreadsheet>")
+    head += "<office:spreadsheet>"
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as ods:
+        # must be the first entry, uncompressed
+        ods.writestr("mimetype", ods_components.mimetype, compress_type=zipfile.ZIP_STORED)
+        ods.writestr("META-INF/manifest.xml", ods_components.manifest_xml)
+        ods.writestr("styles.xml", ods_components.styles_xml)
+
+        with ods.open("content.xml", "w") as content:
+            content.write(head.encode())
+            for sheet in sheets:
+                content.write(f'<table:table table:name={quoteattr(sheet.name)} table:style-name="ta1">'.encode())
+                for row in clean_rows(sheet.rows):
+                    content.write(("<table:table-row>" + "".join(ods_cell(cell) for cell in row) + "</table:table-row>").encode())
+                content.write(b"</table:table>")
+            content.write(tail.encode())
+
+
+def write_ods_pandas(path, sheets: List[Sheet]):
+    import pandas as pd
+
+    # excelwriter has an issue with python linters. ignore this error
+    with pd.ExcelWriter(path, mode="w", engine="odf") as writer: #pylint: disable=abstract-class-instantiated
+        for sheet in sheets:
+            df = pd.DataFrame(list(clean_rows(sheet.rows)))
+            df.to_excel(writer, sheet_name=sheet.name, header=False, index=False)
+
+
+def write_csv(base_path, sheets: List[Sheet]):
+    for sheet in sheets:
+        with open(f"{base_path}-{sheet.name}.csv", "w", newline="") as file:
+            writer = csv.writer(file)
+            for row in clean_rows(sheet.rows):
+                writer.writerow(["" if cell is None else cell for cell in row])
+
+
+def write_jsonl(path, sheets: List[Sheet]):
+    with open(path, "w") as file:
+        for sheet in sheets:
+            for row in clean_rows(sheet.rows):
+                file.write(json.dumps({"sheet": sheet.name, "row": row}) + "\n")
+
+
+# sheets are built by a callable, since the rows of a sheet can only be consumed once
+def write_results(event_id: int, build_sheets, output_formats: List[str]):
+    base = f"{c.results_path}/lmc{event_id}-results"
+
+    for output_format in output_formats:
+        if output_format == "ods":
+            write_ods(f"{base}.ods", build_sheets())
+        elif output_format == "csv":
+            write_csv(base, build_sheets())
+        elif output_format == "jsonl":
+            write_jsonl(f"{base}.jsonl", build_sheets())
+        else:
+            raise ValueError(f"unknown results format {output_format}")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# all the lmcN-scoreboard.json files, compiled into one in-memory index
+#
+# rebuilt only when a results file is added, removed or changed (checked every couple of seconds).
+# answers the per-event scoreboards and the per-artist histories without touching the disk.
+
+import os
+import re
+import json
+from typing import Dict, List, Optional
+import common as c
+
+
+scoreboard_pattern = re.compile(r"lmc(\d+)-scoreboard\.json")
+
+stat_keys = ["score", "average", "5s", "4s", "3s", "2s", "1s"]
+
+
+def list_scoreboard_files() -> List[str]:
+    if not os.path.isdir(c.results_path):
+        return []
+
+    files = [os.path.join(c.results_path, f) for f in os.listdir(c.results_path) if scoreboard_pattern.fullmatch(f)]
+    # the directory itself, so that new files are picked up too
+    return [c.results_path] + sorted(files)
+
+
+class ScoreboardIndex:
+    def __init__(self):
+        # event id -> scoreboard as stored in the file, {placement: {name, score, ...}}
+        self.scoreboards = {}
+        # artist -> [{event, placement, entries, score, ...}] sorted by event
+        self.artists = {}
+
+    def add(self, event_id: int, scoreboard: Dict):
+        self.scoreboards[event_id] = scoreboard
+
+        for placement, entry in scoreboard.items():
+            result = {
+                "event": event_id,
+                "placement": int(placement) if placement.isdigit() else placement,
+                "entries": len(scoreboard),
+            }
+            for k in stat_keys:
+                if k in entry:
+                    result[k] = entry[k]
+            self.artists.setdefault(entry["name"], []).append(result)
+
+    def finish(self):
+        for results in self.artists.values():
+            results.sort(key=lambda r: r["event"])
+
+
+def build_index() -> ScoreboardIndex:
+    index = ScoreboardIndex()
+
+    for path in list_scoreboard_files()[1:]:
+        event_id = int(scoreboard_pattern.fullmatch(os.path.basename(path)).group(1))
+        with open(path, "r") as json_file:
+            index.add(event_id, json.load(json_file))
+
+    index.finish()
+    return index
+
+
+# listing and stat-ing every results file on each request would defeat the point
+_index_cache = c.FileCache(build_index, list_scoreboard_files, check_interval=2)
+
+
+# fresh skips the check interval. pages cached by respcache need it: they're rendered as soon as
+# a results file changes, and an index a couple of seconds old would stay cached with them
+def get_index(fresh=False) -> ScoreboardIndex:
+    return _index_cache.get(fresh)
+
+
+def get_scoreboard(event_id: int, fresh=False) -> Dict:
+    return get_index(fresh).scoreboards.get(int(event_id), {})
+
+
+def get_artist_history(artist: str) -> Optional[List[Dict]]:
+    return get_index().artists.get(artist)
+
+
+def get_artists() -> List[str]:
+    return sorted(get_index().artists.keys(), key=str.lower)
+
+
+def get_event_summary(event_id: int) -> Optional[Dict]:
+    scoreboard = get_index().scoreboards.get(int(event_id))
+    if scoreboard is None:
+        return None
+
+    ranked = [entry for placement, entry in scoreboard.items() if placement.isdigit()]
+    summary = {
+        "event": int(event_id),
+        "entries": len(scoreboard),
+        "disqualified": len(scoreboard) - len(ranked),
+        "winner": scoreboard["1"]["name"] if "1" in scoreboard else None,
+        "top_score": ranked[0]["score"] if ranked else None,
+        "total_score": sum(entry["score"] for entry in ranked),
+        "placements": [
+            {"placement": int(placement) if placement.isdigit() else placement, "name": entry["name"]}
+            for placement, entry in scoreboard.items()
+        ],
+    }
+    return summary
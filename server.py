@@ -1,23 +1,38 @@
 #!/usr/bin/env python3
 
-from flask import Flask, request, render_template, redirect, url_for, make_response
+from flask import Flask, request, render_template, redirect, url_for, make_response, g
+from jinja2 import FileSystemBytecodeCache
 import flask_login
-from werkzeug.security import generate_password_hash, check_password_hash
-import internetarchive
-from tinydb import TinyDB, Query
-import csv
-from datetime import datetime
-import markdown
-import feedgenerator
 import common as c
+import catalog
+import archive
+import winners
+import scoreboards
+import tally
+import journal
+import voting
+import metrics
+import profiler
+import registry
+import ingest
+from respcache import cached_response
+from userstore import user_store
 import os
-import json
 import re
+import time
+import contextvars
 from typing import List, Dict, Tuple, Optional, Union
 # import re
 
+# markdown, feedgenerator and werkzeug.security are imported in the functions that use them,
+# to keep the startup of a worker short
+
 app = Flask(__name__)
 
+# compiled templates are kept on disk, so a new worker doesn't compile them again
+os.makedirs(c.jinja_cache_path, exist_ok=True)
+app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(c.jinja_cache_path)}
+
 
 with open("secret/secret_key", "r") as file:
     app.secret_key = file.read().rstrip()
@@ -26,11 +41,24 @@ with open("secret/secret_key", "r") as file:
 login_manager = flask_login.LoginManager()
 login_manager.init_app(app)
 
+# before any other hook. does nothing unless profiling is enabled
+profiler.install(app, lambda: user_is_admin())
+
 
 def main():
     app.run(debug=True)
 
 
+# loads what can be shared by all workers. gunicorn.conf.py calls this in the master process
+# before forking, so the workers start with it already in (copy-on-write) memory
+def preload():
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    catalog.get_events()
+    scoreboards.get_index()
+
+
 # ================================================================================
 # AUTH
 # ================================================================================
@@ -47,40 +75,37 @@ def is_valid_username_input(text):
 
 
 def user_exists(username):
-    db = TinyDB(c.users_db)
-    # db.update(set_vote(artist, vote), Query().user == user)
-    query_data = db.search(Query().username == username)
+    return user_store.exists(username)
 
-    if len(query_data) == 1:
-        return True
-    return False
+
+def hash_password(password):
+    from werkzeug.security import generate_password_hash
+
+    with metrics.password_hash.time("generate"):
+        return generate_password_hash(password)
 
 
 def create_user(username, password):
-    db = TinyDB(c.users_db)
-    db.insert({'username': username, 'password': generate_password_hash(password)})
+    user_store.create(username, hash_password(password))
 
 
 def update_password(username, new_password):
-    db = TinyDB(c.users_db)
-    db.update({'password': generate_password_hash(new_password)}, Query().username == username)
+    user_store.update_password(username, hash_password(new_password))
 
 
 # returns error message. empty string for ok
 def update_or_create_user_if_needed(username, password) -> str:
-    db = TinyDB(c.users_db)
-    query_data = db.search(Query().username == username)
+    user_data = user_store.get(username)
 
-    if len(query_data) == 1:
-        if query_data[0]['password'] == '':
+    if user_data is not None:
+        if user_data['password'] == '':
             # update password
             # after the password is cleared from the database (i.e. = ""), it can be reset
             update_password(username, password)
     else:
         # user not in database, so create user
-        available_usernames = c.get_available_usernames()
         # query_data = db.search(Query().username.matches(username, flags=re.IGNORECASE))
-        if not username in available_usernames:
+        if not registry.get().is_user(username):
             return "Cannot register with this username. If you're not a participant but want to vote, let us know and we'll enable an account for you."
         else:
             create_user(username, password)
@@ -90,15 +115,19 @@ def update_or_create_user_if_needed(username, password) -> str:
 
 
 def try_login(username, password):
-    db = TinyDB(c.users_db)
-    query_data = db.search(Query().username == username)
+    user_data = user_store.get(username)
 
     def authenticate_user(username):
         user = User()
         user.id = username
         flask_login.login_user(user)
 
-    if check_password_hash(query_data[0]['password'], password):
+    from werkzeug.security import check_password_hash
+
+    with metrics.password_hash.time("check"):
+        password_ok = check_password_hash(user_data['password'], password)
+
+    if password_ok:
         authenticate_user(username)
         return True
     else:
@@ -188,47 +217,47 @@ def unauthorized_handler():
 
 
 # ================================================================================
-# UTILS
+# METRICS
 # ================================================================================
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
 
-def user_is_authenticated():
-    return flask_login.current_user.is_authenticated
 
+@app.after_request
+def observe_request_duration(response):
+    # the route pattern, so that /results/1 and /results/2 are the same series
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.request_duration.observe(
+        time.perf_counter() - g.request_started, route, request.method, str(response.status_code)
+    )
+    return response
 
-def get_events():
-    events = []
-    with open(c.events_datafile, 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            events.append(row)
 
-    return events
+# ================================================================================
+# UTILS
+# ================================================================================
 
 
-def get_event(event_id: int) -> Dict:
-    # TODO: cache get_events()?
-    for e in get_events():
-        if e['id'] == str(event_id):
-            return e
-    return {}
+def user_is_authenticated():
+    return flask_login.current_user.is_authenticated
 
 
-def get_scoreboard(event_id: int) -> Dict:
-    scoreboard = {}
-    filename = f"{c.results_path}/lmc{event_id}-scoreboard.json"
-    if not os.path.exists(filename):
-        # print("Missing results data for this event")
-        return {}
+def get_events() -> List[catalog.Event]:
+    return catalog.get_events()
+
 
-    with open(filename, 'r') as json_file:
-        scoreboard = json.load(json_file)
+def get_event(event_id: int) -> Optional[catalog.Event]:
+    return catalog.get_event(event_id)
 
-    return scoreboard
+
+# (event id, entries) already awaited by the async front in asgi.py for the current request
+prefetched_entries = contextvars.ContextVar("prefetched_entries", default=None)
 
 
 def is_event_id_valid(event_id):
-    if get_event(event_id) != {}:
+    if get_event(event_id) is not None:
         return True
     return False
 
@@ -237,24 +266,25 @@ def get_current_user():
     return flask_login.current_user.id
 
 
-def to_date_object(date_str):
-    return datetime.strptime(date_str, "%d/%m/%y")
-
+# the same voting state for the whole request, even if the schedule moves on halfway through
+def get_voting_state() -> voting.VotingState:
+    if 'voting_state' not in g:
+        g.voting_state = voting.get_voting_state()
+    return g.voting_state
 
-def get_month_and_year(date_str):
-    date_object = to_date_object(date_str)
 
-    # Extract the month name and year number from the datetime object
-    month_name = date_object.strftime("%B")
-    year_number = date_object.strftime("%Y")
+def get_admin_user():
+    with open("secret/admin_user", "r") as file:
+        return file.read().rstrip()
 
-    # Create the formatted string
-    result = f"{month_name} {year_number}"
 
-    return result
+def user_is_admin():
+    return user_is_authenticated() and get_current_user() == get_admin_user()
 
 
 def markdown_to_html(markdown_text):
+    import markdown
+
     html = markdown.markdown(markdown_text)
     return html
 
@@ -265,6 +295,39 @@ def read_text_file(file_path):
     return contents
 
 
+def template_path(name):
+    return os.path.join(app.root_path, app.template_folder, name)
+
+
+# ========================================
+# sources of the cached pages
+
+def rss_sources():
+    return [c.events_datafile]
+
+
+def rules_sources():
+    return [c.rules_md, template_path("rules.html"), template_path("base.html")]
+
+
+def events_sources():
+    return [
+        c.events_datafile,
+        c.winner_entries_file,
+        template_path("events.html"),
+        template_path("base.html"),
+    ] + [c.get_scoreboard_filename(e.id) for e in get_events()]
+
+
+def results_sources(event_id):
+    return [
+        c.events_datafile,
+        c.get_scoreboard_filename(event_id),
+        template_path("results.html"),
+        template_path("base.html"),
+    ]
+
+
 # ================================================================================
 # API - PUBLIC
 # ================================================================================
@@ -272,28 +335,65 @@ def read_text_file(file_path):
 
 @app.route("/get_entries/<int:event_id>", methods=["GET"])
 def get_entries(event_id: int):
-    if not is_event_id_valid(event_id):
+    event_data = get_event(event_id)
+    if event_data is None:
         return "Invalid event ID"
 
-    event_data = get_event(event_id)
-    item = internetarchive.get_item(event_data["archive"])
-
-    allowed_formats = [".flac", ".ogg"]
-    entries = []
-    for file in item.files:
-        if file["source"] == "original":
-            allowed = False
-            for ext in allowed_formats:
-                if file["name"].endswith(ext):
-                    allowed = True
-                    break
-            if allowed:
-                entry = os.path.splitext(file["name"])[0].split(" - ", 1)
-                # we should maybe convert artist to username in here and send that along?
-                # but maybe more chances to go wrong
-                entries.append({"artist": entry[0], "track": entry[1], "filename": file["name"]})
-
-    return entries
+    # built at submission time, no need to ask archive.org
+    entries = ingest.get_manifest_entries(event_id)
+    if entries is not None:
+        return entries
+
+    prefetched = prefetched_entries.get()
+    if prefetched is not None and prefetched[0] == event_id:
+        return prefetched[1]
+
+    # the entry list of an event can't change anymore once the winner is announced
+    return archive.entries_cache.get(event_data.archive, permanent=event_data.closed)
+
+
+@app.route("/api/artists", methods=["GET"])
+def api_artists():
+    return scoreboards.get_artists()
+
+
+@app.route("/api/artists/<artist>", methods=["GET"])
+def api_artist_history(artist: str):
+    history = scoreboards.get_artist_history(artist)
+    if history is None:
+        return {"error": "Unknown artist"}, 404
+
+    return {"artist": artist, "results": history}
+
+
+@app.route("/api/events", methods=["GET"])
+def api_events():
+    # events.csv is checked once, not once per event
+    events = {e.id: e for e in catalog.get_events()}
+
+    summaries = []
+    for event_id in sorted(scoreboards.get_index().scoreboards):
+        summaries.append(event_summary(event_id, events.get(event_id)))
+    return summaries
+
+
+@app.route("/api/events/<int:event_id>", methods=["GET"])
+def api_event_summary(event_id: int):
+    summary = event_summary(event_id, get_event(event_id))
+    if summary is None:
+        return {"error": "No results for this event"}, 404
+
+    return summary
+
+
+def event_summary(event_id: int, event: Optional[catalog.Event]) -> Optional[Dict]:
+    summary = scoreboards.get_event_summary(event_id)
+    if summary is None:
+        return None
+
+    if event is not None:
+        summary = dict(summary, title=event.title, month=event.month_year)
+    return summary
 
 
 @app.route("/ping")
@@ -301,10 +401,32 @@ def ping():
     return "pong"
 
 
+@app.route("/cache_stats")
+@flask_login.login_required
+def cache_stats():
+    if not user_is_admin():
+        return 'Unauthorized', 401
+
+    return {"entries": archive.entries_cache.stats()}
+
+
 # ================================================================================
 # API - PRIVATE
 # ================================================================================
 
+# prometheus metrics. for the admin, and for localhost if c.metrics_allow_localhost
+@app.route("/metrics")
+def metrics_page():
+    local = c.metrics_allow_localhost and request.remote_addr in ("127.0.0.1", "::1")
+    if not local and not user_is_admin():
+        return 'Unauthorized', 401
+
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+valid_votes = {"1", "2", "3", "4", "5"}
+
+
 @app.route("/save_votes", methods=["POST"])
 @flask_login.login_required
 def save_votes():
@@ -312,23 +434,52 @@ def save_votes():
     # form for form post
     # args for get url params
 
-    if not c.is_voting_open():
+    voting_state = get_voting_state()
+    if not voting_state.open:
         return {}
 
+    users = registry.get()
+
     user_votes = {}
     for k,v in request.form.items():
         if k.startswith("vote"):
             artist = k.replace("vote_", "")
             vote = v
+            # checked before anything reaches the journal, every worker replays it
+            if not users.is_participant(voting_state.event_id, artist) or vote not in valid_votes:
+                return "Invalid vote", 400
             user_votes[artist] = vote
 
+    # the tally follows the journal, so it's updated by the save below
+    tally.get_live_tally(voting_state.event_id)
+    journal.get_vote_journal().save_votes(voting_state.event_id, get_current_user(), user_votes)
 
-    db = c.get_votes_db(c.get_current_voting_event())
+    return {}
 
-    user = get_current_user()
-    db.upsert({"user": user, "votes": user_votes}, Query().user == user)
 
-    return {}
+@app.route("/live_tally", methods=["GET"])
+@flask_login.login_required
+def live_tally():
+    if not user_is_admin():
+        return 'Unauthorized', 401
+
+    event_id = get_voting_state().event_id
+    if event_id == 0:
+        return {}
+
+    live = tally.get_live_tally(event_id)
+    vote_journal = journal.get_vote_journal()
+    vote_journal.catch_up()
+
+    data = {
+        "event": event_id,
+        "standings": live.standings(),
+        "missing_voters": live.missing_voters(),
+    }
+    # cross-check the running totals against a full recompute
+    if request.args.get("verify"):
+        data["differences"] = live.verify(vote_journal.get_event_votes(event_id))
+    return data
 
 
 @app.route("/get_my_votes/<int:event_id>", methods=["POST"])
@@ -337,12 +488,7 @@ def get_user_votes(event_id: int):
     if not is_event_id_valid(event_id):
         return "Invalid event ID"
 
-    db = c.get_votes_db(event_id)
-    db_data = db.search(Query().user == get_current_user())
-
-    votes = {}
-    if len(db_data) > 0:
-        votes = db_data[0]["votes"]
+    votes = journal.get_vote_journal().get_votes(event_id, get_current_user())
     # else:
     #     print("initializing db entry for ", get_current_user(), event_id)
     #     # this initializes the db entry (with empty votes)
@@ -363,7 +509,10 @@ def home():
 
 
 @app.route("/rss")
+@cached_response(rss_sources)
 def rss():
+    import feedgenerator
+
     events = get_events()
 
     # Create a feed object
@@ -377,14 +526,13 @@ def rss():
     )
 
     for event in events:
-        date_obj = datetime.strptime(event["date"], '%d/%m/%y')
-        month_year = date_obj.strftime('%B %Y')
+        month_year = event.month_year
         feed.add_item(
-            title=f'"{event["title"]}" - LMC #{event["id"]} ({month_year})',
-            link=event["link"],
-            description=f'The theme for the month of {month_year} is: {event["title"]}\n{event["link"]}',
-            unique_id=event["id"],
-            pubdate=to_date_object(event["date"]),
+            title=f'"{event.title}" - LMC #{event.id} ({month_year})',
+            link=event.link,
+            description=f'The theme for the month of {month_year} is: {event.title}\n{event.link}',
+            unique_id=str(event.id),
+            pubdate=event.date,
         )
 
     # Generate the XML for the feed
@@ -398,6 +546,7 @@ def rss():
 
 
 @app.route("/rules")
+@cached_response(rules_sources)
 def rules():
     rules = read_text_file(c.rules_md)
     html_output = markdown_to_html(rules)
@@ -407,10 +556,11 @@ def rules():
 @app.route("/vote")
 def vote():
     if user_is_authenticated():
+        voting_state = get_voting_state()
         return render_template(
             "vote.html",
-            event=get_event(c.get_current_voting_event()),
-            locked=(not c.is_voting_open()),
+            event=get_event(voting_state.event_id),
+            locked=(not voting_state.open),
             user=get_current_user()
         )
     else:
@@ -419,7 +569,8 @@ def vote():
 
 @app.route("/load_current_entries", methods=["GET"])
 def load_current_entries():
-    current_event = c.get_current_voting_event()
+    voting_state = get_voting_state()
+    current_event = voting_state.event_id
 
     if current_event == 0:
         return {}
@@ -430,59 +581,55 @@ def load_current_entries():
             event=get_event(current_event),
             entries=get_entries(current_event),
             votes=votes,
-            locked=(not c.is_voting_open())
+            locked=(not voting_state.open)
         )
 
 
-def fetch_winner_entry_track(event_id) -> str:
-    if event_id >= 18:
-        event = get_event(event_id)
-        entries = get_entries(event_id)
-        print(event['winner'])
-        for entry in entries:
-            if entry['artist'] == event['winner']:
-                winner_entry = entry
-                winner_track_url = event['archive'] + "/" + winner_entry['filename']
-                return winner_track_url
-    return None
-
-
 @app.route('/events', methods=["GET"])
 def events():
-    events = get_events()
-    for event in events:
-        event['month_date'] = get_month_and_year(event['date'])
-        event['winner'] = event['winner'].replace("\n", ", ")
-        event['scoreboard'] = get_scoreboard(event['id'])
+    # resolved in the background by winners.py, so we never contact archive.org from here
+    if winners.has_missing():
+        winners.resolve_in_background()
+
+    return events_page()
+
+
+@cached_response(events_sources)
+def events_page():
+    winner_entries = winners.get_winner_entries()
+    index = scoreboards.get_index(fresh=True)
+
+    # the catalog records are shared, so we build a view dict for each event
+    events = []
+    for e in get_events():
+        event = e.to_dict()
+        event['month_date'] = e.month_year
+        event['winner'] = e.winner.replace("\n", ", ")
+        event['scoreboard'] = index.scoreboards.get(e.id, {})
         # event['archive'] = event['archive'].replace("---", "")
 
-        event['winner_entry'] = None
+        event['winner_entry'] = winner_entries.get(str(e.id))
+        events.append(event)
 
 
     events.reverse()
     return render_template("events.html", events=events)
 
 
+# the admin gets a different page, so that one is never cached
 @app.route('/results/<int:event_id>', methods=["GET"])
+@cached_response(results_sources, bypass=lambda: user_is_admin())
 def results(event_id: int):
     event = get_event(event_id)
-    if event == {}:
+    if event is None:
         return "Invalid event ID"
 
-    if event['winner'] == "?":
+    if event.winner == "?":
         return "Results not yet announced"
 
-    results = get_scoreboard(event_id)
-
-    admin_user = ""
-    with open("secret/admin_user", "r") as file:
-        admin_user = file.read().rstrip()
-
-    admin = False
-    if user_is_authenticated() and get_current_user() == admin_user:
-        admin = True
+    results = scoreboards.get_scoreboard(event_id, fresh=True)
 
-    return render_template("results.html", event=event, results=results, admin=admin)
+    return render_template("results.html", event=event, results=results, admin=user_is_admin())
 
 
 if __name__ == "__main__":
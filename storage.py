@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+
+# storage of votes and registered users
+#
+# two backends implement the same interface:
+# - TinyDBStorage: tinydb json files. users in storage/users.json,
+#   votes sharded into one file per event in storage/votes/ (lmcN.json)
+# - SQLiteStorage: a single sqlite database in WAL mode. writes only touch the affected row,
+#   and concurrent workers stay consistent
+#
+# the backend is chosen with c.storage_backend
+#
+# the shard of a past event can be frozen: it's made read-only, and optionally gzipped (lmcN.json.gz).
+# frozen shards are loaded once and kept in memory
+#
+# usage:
+#   storage.py split                    split the old single votes.json into per-event shards
+#   storage.py freeze <id> [compress]   freeze the shard of a past event
+#   storage.py migrate                  copy the tinydb files into the sqlite database
+
+from tinydb import TinyDB, Query
+from tinydb.storages import JSONStorage
+import sqlite3
+import json
+import gzip
+import os
+import re
+import stat
+import sys
+import threading
+from typing import List, Dict, Optional
+import common as c
+import metrics
+
+
+class Storage:
+    # votes of a user for an event, {artist: vote}
+    def get_votes(self, event_id: int, user: str) -> Dict:
+        raise NotImplementedError
+
+    # replaces all votes of a user for an event
+    def save_votes(self, event_id: int, user: str, votes: Dict):
+        raise NotImplementedError
+
+    # all ballots of an event, [{"user": ..., "votes": {...}}] in the order they were first cast
+    def get_event_votes(self, event_id: int) -> List[Dict]:
+        raise NotImplementedError
+
+    # ids of the events that have votes
+    def get_event_ids(self) -> List[int]:
+        raise NotImplementedError
+
+    # all registered users, [{"username": ..., "password": ...}]
+    def get_users(self) -> List[Dict]:
+        raise NotImplementedError
+
+    def create_user(self, username: str, password_hash: str):
+        raise NotImplementedError
+
+    def update_password(self, username: str, password_hash: str):
+        raise NotImplementedError
+
+    # changes whenever the users are modified, also by other processes
+    def users_version(self):
+        raise NotImplementedError
+
+
+# ================================================================================
+# TINYDB
+# ================================================================================
+
+class FrozenShardError(Exception):
+    pass
+
+
+def read_tinydb_file(path) -> Dict:
+    opener = gzip.open if path.endswith(".gz") else open
+    metrics.tinydb_file_opens.inc("votes")
+    metrics.tinydb_reads.inc("votes")
+    with opener(path, "rt") as file:
+        return json.load(file)
+
+
+# counts the file accesses of tinydb. db labels the metrics, "users" or "votes"
+class CountingJSONStorage(JSONStorage):
+    def __init__(self, path, db="", **kwargs):
+        super().__init__(path, **kwargs)
+        self.db = db
+        metrics.tinydb_file_opens.inc(db)
+
+    def read(self):
+        metrics.tinydb_reads.inc(self.db)
+        return super().read()
+
+    def write(self, data):
+        metrics.tinydb_writes.inc(self.db)
+        super().write(data)
+
+
+class TinyDBStorage(Storage):
+    def __init__(self, users_path, votes_path):
+        self.users_path = users_path
+        # directory with one shard per event
+        self.votes_path = votes_path
+        # path -> FileCache of the ballots of a frozen shard
+        self._frozen = {}
+
+    def shard_path(self, event_id: int) -> str:
+        return os.path.join(self.votes_path, f"lmc{event_id}.json")
+
+    def _frozen_shard(self, event_id: int) -> Optional[str]:
+        path = self.shard_path(event_id)
+        if os.path.exists(path + ".gz"):
+            return path + ".gz"
+        # checks the mode rather than os.access(), which is always true for root
+        if os.path.exists(path) and not os.stat(path).st_mode & stat.S_IWUSR:
+            return path
+        return None
+
+    def _frozen_ballots(self, path) -> List[Dict]:
+        if path not in self._frozen:
+            def load():
+                documents = read_tinydb_file(path).get("_default", {})
+                return [documents[doc_id] for doc_id in sorted(documents, key=int)]
+            self._frozen[path] = c.FileCache(load, [path])
+        return self._frozen[path].get()
+
+    # a new handle for every operation. tinydb tables cache the next document id and query results,
+    # which go stale as soon as another worker writes to the same file
+    def _votes_table(self, event_id: int):
+        if self._frozen_shard(event_id):
+            raise FrozenShardError(f"votes of event {event_id} are frozen")
+
+        os.makedirs(self.votes_path, exist_ok=True)
+        db = TinyDB(self.shard_path(event_id), storage=CountingJSONStorage, db="votes")
+        table = db.table("_default")
+        # this call is required to setup the table in case it's empty (?)
+        table.all()
+
+        return table
+
+    def _users_table(self):
+        return TinyDB(self.users_path, storage=CountingJSONStorage, db="users")
+
+    def get_votes(self, event_id, user):
+        frozen = self._frozen_shard(event_id)
+        if frozen:
+            for ballot in self._frozen_ballots(frozen):
+                if ballot["user"] == user:
+                    return ballot["votes"]
+            return {}
+
+        if not os.path.exists(self.shard_path(event_id)):
+            return {}
+
+        db_data = self._votes_table(event_id).search(Query().user == user)
+        if len(db_data) > 0:
+            return db_data[0]["votes"]
+        return {}
+
+    def save_votes(self, event_id, user, votes):
+        self._votes_table(event_id).upsert({"user": user, "votes": votes}, Query().user == user)
+
+    def get_event_votes(self, event_id):
+        frozen = self._frozen_shard(event_id)
+        if frozen:
+            return self._frozen_ballots(frozen)
+
+        if not os.path.exists(self.shard_path(event_id)):
+            return []
+        return self._votes_table(event_id).all()
+
+    def get_event_ids(self):
+        if not os.path.isdir(self.votes_path):
+            return []
+
+        event_ids = set()
+        for filename in os.listdir(self.votes_path):
+            match = re.fullmatch(r"lmc(\d+)\.json(\.gz)?", filename)
+            if match:
+                event_ids.add(int(match.group(1)))
+        return sorted(event_ids)
+
+    # makes the shard of an event read-only. with compress, it's replaced by a gzipped copy.
+    # use journal.VoteJournal.freeze, this doesn't know about the votes still in the journal
+    def freeze(self, event_id: int, compress=False):
+        path = self.shard_path(event_id)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+
+        if compress:
+            with open(path, "rb") as file, gzip.open(path + ".gz.tmp", "wb") as gz_file:
+                gz_file.write(file.read())
+            os.chmod(path + ".gz.tmp", stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(path + ".gz.tmp", path + ".gz")
+            os.remove(path)
+        else:
+            os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+    # splits the old single file, with one table per event, into shards
+    def import_single_file(self, single_path):
+        single_db = TinyDB(single_path, access_mode="r")
+        for table_name in sorted(single_db.tables(), key=int):
+            path = self.shard_path(int(table_name))
+            if os.path.exists(path) or os.path.exists(path + ".gz"):
+                print(f"event {table_name}: shard already exists, skipping")
+                continue
+
+            os.makedirs(self.votes_path, exist_ok=True)
+            # keep the document ids, they define the ballot order
+            documents = single_db.storage.read()[table_name]
+            with open(path, "w") as file:
+                json.dump({"_default": documents}, file)
+            print(f"event {table_name}: {len(documents)} ballots")
+
+    def get_users(self):
+        return self._users_table().all()
+
+    def create_user(self, username, password_hash):
+        self._users_table().insert({'username': username, 'password': password_hash})
+
+    def update_password(self, username, password_hash):
+        self._users_table().update({'password': password_hash}, Query().username == username)
+
+    def users_version(self):
+        return c.file_mtime(self.users_path)
+
+
+# ================================================================================
+# SQLITE
+# ================================================================================
+
+sqlite_schema = """
+CREATE TABLE IF NOT EXISTS ballots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    votes TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ballots_event_user ON ballots (event_id, user);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL
+);
+"""
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    # one connection per thread (and per process, connections must not cross a fork)
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(sqlite_schema)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_votes(self, event_id, user):
+        row = self._connection().execute(
+            "SELECT votes FROM ballots WHERE event_id = ? AND user = ?", (event_id, user)
+        ).fetchone()
+        if row is None:
+            return {}
+        return json.loads(row[0])
+
+    def save_votes(self, event_id, user, votes):
+        # keeps the id (and so the ordering) of an existing ballot, like a tinydb upsert
+        self._connection().execute(
+            "INSERT INTO ballots (event_id, user, votes) VALUES (?, ?, ?)"
+            " ON CONFLICT (event_id, user) DO UPDATE SET votes = excluded.votes",
+            (event_id, user, json.dumps(votes)),
+        )
+
+    def get_event_ids(self):
+        rows = self._connection().execute("SELECT DISTINCT event_id FROM ballots ORDER BY event_id")
+        return [event_id for (event_id,) in rows]
+
+    def get_event_votes(self, event_id):
+        rows = self._connection().execute(
+            "SELECT user, votes FROM ballots WHERE event_id = ? ORDER BY id", (event_id,)
+        )
+        return [{"user": user, "votes": json.loads(votes)} for user, votes in rows]
+
+    def get_users(self):
+        rows = self._connection().execute("SELECT username, password FROM users ORDER BY id")
+        return [{"username": username, "password": password} for username, password in rows]
+
+    def create_user(self, username, password_hash):
+        self._connection().execute(
+            "INSERT INTO users (username, password) VALUES (?, ?)", (username, password_hash)
+        )
+
+    def update_password(self, username, password_hash):
+        self._connection().execute(
+            "UPDATE users SET password = ? WHERE username = ?", (password_hash, username)
+        )
+
+    def users_version(self):
+        # in WAL mode commits land in the -wal file, checkpoints in the main file
+        return (c.file_mtime(self.path), c.file_mtime(self.path + "-wal"))
+
+    def import_event_votes(self, event_id, ballots):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            for ballot in ballots:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ballots (event_id, user, votes) VALUES (?, ?, ?)",
+                    (event_id, ballot["user"], json.dumps(ballot["votes"])),
+                )
+
+    def import_users(self, users):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            for user in users:
+                conn.execute(
+                    "INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)",
+                    (user["username"], user["password"]),
+                )
+
+
+# ================================================================================
+# BACKEND SELECTION
+# ================================================================================
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(backend: str) -> Storage:
+    if backend == "tinydb":
+        return TinyDBStorage(c.users_db, c.votes_shards_path)
+    elif backend == "sqlite":
+        return SQLiteStorage(c.sqlite_db)
+    raise ValueError(f"unknown storage backend: {backend}")
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage(c.storage_backend)
+    return _storage
+
+
+# ================================================================================
+# MIGRATION
+# ================================================================================
+
+def migrate_tinydb_to_sqlite(users_path=c.users_db, votes_path=c.votes_shards_path, sqlite_path=c.sqlite_db):
+    tinydb_storage = TinyDBStorage(users_path, votes_path)
+    sqlite_storage = SQLiteStorage(sqlite_path)
+
+    for event_id in tinydb_storage.get_event_ids():
+        # tinydb returns the documents in insertion order
+        ballots = tinydb_storage.get_event_votes(event_id)
+        sqlite_storage.import_event_votes(event_id, ballots)
+        print(f"event {event_id}: {len(ballots)} ballots")
+
+    if os.path.exists(users_path):
+        users = tinydb_storage.get_users()
+        sqlite_storage.import_users(users)
+        print(f"users: {len(users)}")
+
+
+def main():
+    args = sys.argv[1:]
+
+    if args == ["split"]:
+        if not os.path.exists(c.votes_db):
+            print(f"{c.votes_db} not found")
+            sys.exit(1)
+        TinyDBStorage(c.users_db, c.votes_shards_path).import_single_file(c.votes_db)
+    elif len(args) in (2, 3) and args[0] == "freeze":
+        compress = args[2:] == ["compress"]
+        # through the journal, which folds the votes of the event into the shard first
+        import journal
+        journal.get_vote_journal().freeze(int(args[1]), compress)
+    elif args == ["migrate"]:
+        migrate_tinydb_to_sqlite()
+    else:
+        print("usage: storage.py split | freeze <event id> [compress] | migrate")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
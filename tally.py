@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+# live standings of the running event, kept up to date vote by vote
+#
+# running aggregates per entry (score and counts of 5s..1s) are updated from the old/new value
+# of each vote change, so reading the standings costs O(entries) instead of a full recompute.
+# scoring follows results.generate_results: self votes don't count, and the ordering is
+# score, then 5s, 4s, 3s, 2s.
+#
+# each participant also has a bitmap of the entries they've voted for, to list the
+# participants who haven't finished voting yet.
+
+import threading
+from typing import Dict, List
+import journal
+import registry
+
+
+vote_values = [5, 4, 3, 2, 1]
+
+
+class LiveTally:
+    def __init__(self, event_id: int, participants: List[str], users_table: Dict[str, str]):
+        self.event_id = event_id
+        # entries are the participating artists
+        self.artists = list(participants)
+        self.artist_index = {artist: i for i, artist in enumerate(self.artists)}
+        # username -> artist
+        self.users_table = users_table
+        self.participant_users = [u for u, artist in users_table.items() if artist in self.artist_index]
+
+        n = len(self.artists)
+        self.score = [0] * n
+        self.counts = {v: [0] * n for v in vote_values}
+
+        # user -> {artist: int vote}
+        self.votes = {}
+        # participant username -> bitmap of the voted entries
+        self.voted = {user: 0 for user in self.participant_users}
+        # participant username -> bitmap of the entries they have to vote for (all but their own)
+        everything = (1 << n) - 1
+        self.required = {
+            user: everything & ~(1 << self.artist_index[users_table[user]]) for user in self.participant_users
+        }
+
+        self._lock = threading.Lock()
+
+    def _is_self_vote(self, user, artist) -> bool:
+        return self.users_table.get(user) == artist
+
+    def set_vote(self, user: str, artist: str, vote):
+        i = self.artist_index.get(artist)
+        if i is None:
+            # not an entry of this event
+            return
+
+        try:
+            new = int(vote)
+        except (TypeError, ValueError):
+            new = None
+        if new not in self.counts:
+            # a listener of the journal mustn't raise. server.save_votes doesn't let these through
+            return
+
+        with self._lock:
+            user_votes = self.votes.setdefault(user, {})
+            old = user_votes.get(artist)
+            if old == new:
+                return
+            user_votes[artist] = new
+
+            if not self._is_self_vote(user, artist):
+                if old is not None:
+                    self.score[i] -= old
+                    self.counts[old][i] -= 1
+                self.score[i] += new
+                self.counts[new][i] += 1
+
+            if user in self.voted:
+                self.voted[user] |= 1 << i
+
+    def add_ballots(self, ballots: List[Dict]):
+        for ballot in ballots:
+            for artist, vote in ballot["votes"].items():
+                self.set_vote(ballot["user"], artist, vote)
+
+    def standings(self) -> List[Dict]:
+        with self._lock:
+            rows = []
+            for i, artist in enumerate(self.artists):
+                row = {"name": artist, "score": self.score[i]}
+                received = sum(self.counts[v][i] for v in vote_values)
+                row["average"] = round(self.score[i] / received, 1) if received else None
+                for v in vote_values:
+                    row[f"{v}s"] = self.counts[v][i]
+                rows.append(row)
+
+        rows.sort(key=lambda r: (r["score"], r["5s"], r["4s"], r["3s"], r["2s"]), reverse=True)
+        return rows
+
+    def missing_voters(self) -> List[str]:
+        with self._lock:
+            return sorted(
+                user for user in self.participant_users
+                if self.voted[user] & self.required[user] != self.required[user]
+            )
+
+    # recomputes everything from the ballots and returns the differences with the running totals
+    def verify(self, ballots: List[Dict]) -> List[str]:
+        fresh = LiveTally(self.event_id, self.artists, self.users_table)
+        fresh.add_ballots(ballots)
+
+        differences = []
+        for i, artist in enumerate(self.artists):
+            if fresh.score[i] != self.score[i]:
+                differences.append(f"{artist}: score {self.score[i]} != {fresh.score[i]}")
+            for v in vote_values:
+                if fresh.counts[v][i] != self.counts[v][i]:
+                    differences.append(f"{artist}: {v}s {self.counts[v][i]} != {fresh.counts[v][i]}")
+        if fresh.missing_voters() != self.missing_voters():
+            differences.append(f"missing voters {self.missing_voters()} != {fresh.missing_voters()}")
+        return differences
+
+
+_tally = None
+_tally_stamp = None
+_tally_lock = threading.Lock()
+
+
+# the tally of the event being voted on, kept up to date with the vote journal
+def get_live_tally(event_id: int) -> LiveTally:
+    global _tally, _tally_stamp
+
+    # participants or usernames changed, start over. a new registry snapshot means either did.
+    # also when the journal was compacted by another process before we had read all of it
+    users = registry.get()
+    vote_journal = journal.get_vote_journal()
+    vote_journal.catch_up()
+    stamp = (event_id, users, vote_journal.resets)
+
+    with _tally_lock:
+        if _tally is None or _tally_stamp != stamp:
+            if _tally is not None:
+                vote_journal.unwatch(_tally.event_id, _tally.set_vote)
+
+            tally = LiveTally(event_id, users.get_participants(event_id), users.users)
+            tally.add_ballots(vote_journal.watch(event_id, tally.set_vote))
+
+            _tally = tally
+            _tally_stamp = stamp
+
+    return _tally
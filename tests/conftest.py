@@ -0,0 +1,57 @@
+# fixtures of the tests
+#
+# the tests run on a small synthetic tree (see benchmarks/synthetic.py) in a temporary directory.
+# like on the real tree, the running event is in events.csv but has no participants yet:
+# they're only known once its submissions are in
+
+import os
+import sys
+import csv
+from typing import NamedTuple, Dict, List
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the app modules are in the parent directory, the synthetic data with the benchmarks
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+
+import synthetic
+
+
+class Tree(NamedTuple):
+    root: str
+    # username -> artist
+    users: Dict[str, str]
+    # event id -> artists
+    participants: Dict[int, List[str]]
+    # the last closed event
+    last_event: int
+    # the running event, without participants
+    current_event: int
+
+
+@pytest.fixture(scope="session")
+def tree(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("lmc"))
+    users, participants = synthetic.generate(path, voters=20, entries=8, events=5)
+    last_event = max(participants)
+    current_event = last_event + 1
+
+    # every synthetic event is closed, and a new one is running
+    with open(os.path.join(path, "data", "events.csv"), "r", newline="") as file:
+        rows = list(csv.reader(file))
+    rows[-1][synthetic.events_header.index("winner")] = participants[last_event][0]
+    rows.append([
+        "01/01/30", current_event, f"Synthetic challenge {current_event}", "anything", "", "?",
+        "", synthetic.archive_identifier(current_event), "", "",
+    ])
+    with open(os.path.join(path, "data", "events.csv"), "w", newline="") as file:
+        csv.writer(file).writerows(rows)
+    with open(os.path.join(path, "storage", "current_voting_event"), "w") as file:
+        file.write(f"{current_event}\n1\n")
+
+    # all paths in common.py are relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(path)
+    yield Tree(path, users, participants, last_event, current_event)
+    os.chdir(cwd)
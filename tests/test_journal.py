@@ -0,0 +1,20 @@
+import journal
+import storage
+
+
+def test_freeze_folds_the_journal_into_the_shard(tree):
+    event_id = 2
+    vote_journal = journal.get_vote_journal()
+    user, artist = next(
+        (u, a) for u in tree.users for a in tree.participants[event_id] if tree.users[u] != a
+    )
+    vote = "1" if vote_journal.get_votes(event_id, user).get(artist) != "1" else "2"
+
+    assert vote_journal.save_votes(event_id, user, {artist: vote})
+    vote_journal.freeze(event_id, compress=True)
+
+    db = storage.get_storage()
+    assert db.get_votes(event_id, user)[artist] == vote
+    # the next compaction doesn't try to write to the frozen shard
+    vote_journal.compact()
+    assert vote_journal.get_votes(event_id, user)[artist] == vote
@@ -0,0 +1,25 @@
+import pytest
+import results
+
+
+@pytest.fixture
+def all_events(monkeypatch):
+    # the synthetic events start at 1
+    monkeypatch.setattr(results, "first_event", 1)
+
+
+def test_batch_skips_event_without_participants(tree, all_events):
+    rows = results.batch_generate([tree.last_event, tree.current_event], missing="skip", jobs=1, force=True)
+
+    assert rows[0]["status"] == "generated"
+    assert rows[1]["status"].startswith("skipped: no participants")
+    assert rows[1]["hash"] is None
+
+
+def test_batch_default_range_leaves_out_events_without_participants(tree, all_events, capsys):
+    results.batch_main(["jobs=1"])
+
+    summary = capsys.readouterr().out.splitlines()
+    events = [int(line.split()[0]) for line in summary[1:] if line.split() and line.split()[0].isdigit()]
+    assert events == sorted(tree.participants)
+    assert results.load_input_hashes().keys() == {str(e) for e in tree.participants}
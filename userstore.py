@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import threading
+from typing import Dict, Optional
+import storage
+
+
+# the registered accounts, indexed by username
+#
+# one instance per process. the index is rebuilt only when the storage reports a change
+# (e.g. a write from another worker), our own writes update it in place.
+# lookups therefore never read the users data.
+class UserStore:
+    def __init__(self, get_storage=storage.get_storage):
+        self._get_storage = get_storage
+        self._index = {}
+        self._version = None
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _sync(self):
+        db = self._get_storage()
+        version = db.users_version()
+        if self._loaded and version == self._version:
+            return
+
+        with self._lock:
+            version = db.users_version()
+            self._index = {user['username']: user for user in db.get_users()}
+            self._version = version
+            self._loaded = True
+
+    def get(self, username) -> Optional[Dict]:
+        self._sync()
+        return self._index.get(username)
+
+    def exists(self, username) -> bool:
+        return self.get(username) is not None
+
+    def create(self, username, password_hash):
+        with self._lock:
+            self._sync()
+            db = self._get_storage()
+            db.create_user(username, password_hash)
+            self._index[username] = {'username': username, 'password': password_hash}
+            self._version = db.users_version()
+
+    def update_password(self, username, password_hash):
+        with self._lock:
+            self._sync()
+            db = self._get_storage()
+            db.update_password(username, password_hash)
+            if username in self._index:
+                self._index[username] = dict(self._index[username], password=password_hash)
+            self._version = db.users_version()
+
+
+user_store = UserStore()
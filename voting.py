@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# which event is being voted on, and whether votes can still be changed
+#
+# by default this follows the schedule in the rules: voting for an event runs from the
+# c.voting_open_day to the c.voting_lock_day of the month after the challenge month
+# (the month of the event date in events.csv). once locked, the event stays up until
+# the voting of the next event opens.
+#
+# the status file (c.current_voting_event_statusfile) can override the schedule:
+#   line 1: event id, 0 to disable voting and showing
+#   line 2: 1 if voting is open, 0 if votes are locked
+# a status file containing "auto", or no status file at all, follows the schedule.
+
+from datetime import datetime
+from typing import NamedTuple, Optional
+import bisect
+import common as c
+import catalog
+
+
+class VotingState(NamedTuple):
+    event_id: int
+    open: bool
+    # "manual" (status file) or "schedule"
+    source: str
+
+
+def _first_of_next_month(date: datetime) -> datetime:
+    if date.month == 12:
+        return datetime(date.year + 1, 1, 1)
+    return datetime(date.year, date.month + 1, 1)
+
+
+# [(opens, locks, event_id)] sorted by opening time
+def build_schedule(events):
+    schedule = []
+    for event in events:
+        # the voting system is in use since event 18
+        if event.id < 18:
+            continue
+        month = _first_of_next_month(event.date)
+        opens = month.replace(day=c.voting_open_day)
+        locks = month.replace(day=c.voting_lock_day)
+        schedule.append((opens, locks, event.id))
+
+    schedule.sort()
+    return schedule
+
+
+def scheduled_state(schedule, now: datetime) -> VotingState:
+    i = bisect.bisect_right([opens for opens, _, _ in schedule], now)
+    if i == 0:
+        return VotingState(0, False, "schedule")
+
+    opens, locks, event_id = schedule[i - 1]
+    return VotingState(event_id, now < locks, "schedule")
+
+
+def _read_statusfile() -> Optional[VotingState]:
+    try:
+        with open(c.current_voting_event_statusfile, "r") as file:
+            lines = [line.strip() for line in file.readlines()]
+    except FileNotFoundError:
+        return None
+
+    if not lines or lines[0] == "auto":
+        return None
+
+    return VotingState(int(lines[0]), bool(int(lines[1])), "manual")
+
+
+_statusfile_cache = c.FileCache(_read_statusfile, [c.current_voting_event_statusfile])
+_schedule_cache = c.FileCache(lambda: build_schedule(catalog.get_events()), [c.events_datafile])
+
+
+def get_voting_state(now: Optional[datetime] = None) -> VotingState:
+    manual = _statusfile_cache.get()
+    if manual is not None:
+        return manual
+
+    return scheduled_state(_schedule_cache.get(), now or datetime.now())
+
+
+def get_current_voting_event() -> int:
+    return get_voting_state().event_id
+
+
+def is_voting_open() -> bool:
+    return get_voting_state().open
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# resolves the archive entry of the winning track of each past event, for the players on /events
+#
+# closed events never change, so results are persisted to c.winner_entries_file
+# and the server only ever reads that file.
+#
+# usage:
+#   winners.py               resolve the events that are missing from the file
+#   winners.py all           re-resolve every event
+#   winners.py refresh <id>  re-resolve a single event (e.g. after fixing its archive item)
+
+import sys
+import os
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+import common as c
+import catalog
+import archive
+import ingest
+import scoreboards
+
+
+max_workers = 4
+# don't hammer archive.org with retries if it's down
+background_retry_interval = 600
+
+# off in processes that mustn't reach archive.org, like export.py
+background_enabled = True
+
+_store_lock = threading.Lock()
+_background_lock = threading.Lock()
+_background_thread = None
+_background_started_at = 0
+
+_winner_entries_cache = c.FileCache(
+    lambda: _read_winner_entries(), [c.winner_entries_file]
+)
+
+
+def _read_winner_entries() -> Dict:
+    if not os.path.exists(c.winner_entries_file):
+        return {}
+
+    with open(c.winner_entries_file, "r") as file:
+        return json.load(file)
+
+
+# event id (as str) -> winner entry dict, or None if no entry matched the winner
+def get_winner_entries() -> Dict:
+    return _winner_entries_cache.get()
+
+
+def needs_winner_entry(event) -> bool:
+    return event.id >= 18 and event.closed and event.archive not in ("", "---")
+
+
+def has_missing() -> bool:
+    winner_entries = get_winner_entries()
+    return any(needs_winner_entry(e) and str(e.id) not in winner_entries for e in catalog.get_events())
+
+
+def find_winner_entry(event) -> Optional[Dict]:
+    entries = ingest.get_manifest_entries(event.id)
+    if entries is None:
+        entries = archive.entries_cache.get(event.archive, permanent=True)
+
+    # the scoreboard has the exact artist name, the csv sometimes lists ties or nicknames
+    winner = event.winner.split("\n")[0]
+    scoreboard = scoreboards.get_scoreboard(event.id)
+    if "1" in scoreboard:
+        winner = scoreboard["1"]["name"]
+
+    for entry in entries:
+        if entry["artist"] == winner:
+            return entry
+    return None
+
+
+def _save(resolved: Dict):
+    with _store_lock:
+        # merge into what's on disk, another process might have written in the meantime
+        winner_entries = dict(_read_winner_entries())
+        winner_entries.update(resolved)
+
+        os.makedirs(os.path.dirname(c.winner_entries_file), exist_ok=True)
+        tmp_file = f"{c.winner_entries_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(winner_entries, file, indent=4)
+        os.replace(tmp_file, c.winner_entries_file)
+
+
+def resolve(events) -> Dict:
+    events = [e for e in events if needs_winner_entry(e)]
+
+    resolved = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {e.id: executor.submit(find_winner_entry, e) for e in events}
+        for event_id, future in futures.items():
+            try:
+                resolved[str(event_id)] = future.result()
+            except Exception as e:
+                # leave it unresolved, it will be retried next time
+                print(f"could not resolve winner entry of event {event_id}: {e}")
+
+    if resolved:
+        _save(resolved)
+    return resolved
+
+
+def resolve_missing() -> Dict:
+    winner_entries = get_winner_entries()
+    return resolve([e for e in catalog.get_events() if str(e.id) not in winner_entries])
+
+
+def refresh(event_id: int) -> Dict:
+    event = catalog.get_event(event_id)
+    if event is None:
+        raise ValueError(f"invalid event id {event_id}")
+
+    # the archive item was corrected, so the cached entry list is wrong too
+    archive.entries_cache.invalidate(event.archive)
+    return resolve([event])
+
+
+# starts resolve_missing() in a background thread, unless one is already running or ran recently
+def resolve_in_background():
+    global _background_thread, _background_started_at
+    if not background_enabled:
+        return
+    with _background_lock:
+        if _background_thread is not None and _background_thread.is_alive():
+            return
+        if time.time() - _background_started_at < background_retry_interval:
+            return
+        _background_started_at = time.time()
+        _background_thread = threading.Thread(target=resolve_missing, daemon=True)
+        _background_thread.start()
+
+
+def main():
+    args = sys.argv[1:]
+
+    if not args:
+        resolved = resolve_missing()
+    elif args[0] == "all":
+        resolved = resolve(catalog.get_events())
+    elif args[0] == "refresh" and len(args) > 1:
+        resolved = refresh(int(args[1]))
+    else:
+        print("usage: winners.py [all | refresh <event id>]")
+        sys.exit(1)
+
+    for event_id, entry in resolved.items():
+        print(f"{event_id}: {entry['filename'] if entry else '-'}")
+
+
+if __name__ == "__main__":
+    main()